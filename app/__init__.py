@@ -4,18 +4,22 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_admin import Admin
-import logging
+from app.logs import configure_logging
 
 
-logging.basicConfig(filename='record.log', level=logging.DEBUG, format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+log_listener = configure_logging(Config)
 
 app = Flask(__name__)
 admin = Admin(app, template_mode='bootstrap3')
 app.config.from_object(Config)
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, render_as_batch=True)
 
 login = LoginManager(app)
 login.login_view = 'login'
 
-from app import routes, models, errors
\ No newline at end of file
+from app import routes, models, errors, cli, database, search, cache, avatars, api, identity, admin_views, assets
+from app.profiler import profiler
+
+if app.config['PROFILER_ENABLED']:
+    profiler.init_app(app, admin)
\ No newline at end of file
@@ -0,0 +1,230 @@
+from flask import abort, redirect, request, url_for
+from flask_admin import BaseView, expose
+from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.filters import FilterEqual, FilterGreater, FilterSmaller
+from sqlalchemy import and_, func, or_, select, text
+from app import app, db, admin
+from app.cache import LRUCache
+from app.graph import unfollow_many
+from app.models import User, Post, Room, PostLike, Reply, TimelineEntry, followers, members, \
+    mark_changed
+from app.timeline import get_timeline
+
+_estimates = LRUCache(100, app.config['ADMIN_COUNT_TTL'])
+
+
+def estimate_count(table):
+    """Approximate row count for ``table`` from planner statistics.
+
+    PostgreSQL keeps one in pg_class; SQLite has sqlite_stat1 once ANALYZE
+    has run (see `flask analyze`), and max(rowid) before that. Results are
+    cached for ADMIN_COUNT_TTL seconds.
+    """
+    count = _estimates.get(table.name)
+    if count is not None:
+        return count
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        count = db.session.execute(text(
+            'SELECT reltuples::bigint FROM pg_class WHERE relname = :t'), {'t': table.name}).scalar()
+    elif dialect == 'sqlite':
+        stat = None
+        if db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")).scalar():
+            stat = db.session.execute(text(
+                'SELECT stat FROM sqlite_stat1 WHERE tbl = :t LIMIT 1'), {'t': table.name}).scalar()
+        if stat:
+            count = int(stat.split()[0])
+        else:
+            count = db.session.execute(select(func.max(text('rowid'))).select_from(table)).scalar()
+    else:
+        count = db.session.execute(select(func.count()).select_from(table)).scalar()
+
+    count = max(count or 0, 0)
+    _estimates.set(table.name, count)
+    return count
+
+
+class KeysetModelView(ModelView):
+    """A ModelView that never counts or offsets.
+
+    Lists are newest-first on the primary key and paged with ``?before=<id>``,
+    the row count shown is an estimate, and filters should be equality or
+    range tests on indexed columns. ``column_list`` should name columns only,
+    so rendering a page doesn't lazy load a relationship per row.
+    """
+
+    list_template = 'admin/keyset_list.html'
+    page_size = 50
+    can_set_page_size = False
+    simple_list_pager = True
+    column_display_pk = True
+    column_sortable_list = ()
+    column_searchable_list = ()
+
+    def estimated_count(self):
+        return estimate_count(self.model.__table__)
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        page_size = page_size or self.page_size
+        query = self.get_query()
+        if filters and self._filters:
+            query, _, _, _ = self._apply_filters(query, None, {}, {}, filters)
+
+        pk = getattr(self.model, self._primary_key)
+        before = request.args.get('before', type=int)
+        if before is not None:
+            query = query.filter(pk < before)
+        query = query.order_by(pk.desc()).limit(page_size)
+        return None, query.all() if execute else query
+
+
+class UserAdmin(KeysetModelView):
+    column_list = ('id', 'username', 'email', 'karma', 'last_seen')
+    column_filters = (FilterEqual(User.username, 'Username'), FilterEqual(User.email, 'Email'))
+    column_exclude_list = ('password_hash',)
+    form_excluded_columns = ('password_hash', 'avatar_hash', 'posts', 'replies', 'followed',
+                             'followers', 'liked', 'rooms')
+
+
+class PostAdmin(KeysetModelView):
+    column_list = ('id', 'body', 'timestamp', 'user_id', 'room_id', 'like_count', 'reply_count')
+    column_filters = (FilterEqual(Post.user_id, 'User id'), FilterEqual(Post.room_id, 'Room id'),
+                      FilterGreater(Post.timestamp, 'Timestamp'),
+                      FilterSmaller(Post.timestamp, 'Timestamp'))
+    form_excluded_columns = ('likes', 'replies', 'like_count', 'reply_count')
+    form_ajax_refs = {'author': {'fields': ('username',)}, 'room': {'fields': ('name',)}}
+
+    def on_model_delete(self, model):
+        # Take the post's likes, replies and room slot back out of the counters
+        User.query.filter_by(id=model.user_id).update(
+            {User.karma: User.karma - model.like_count}, synchronize_session='evaluate')
+        if model.room_id is not None:
+            Room.query.filter_by(id=model.room_id).update(
+                {Room.post_count: Room.post_count - 1}, synchronize_session='evaluate')
+        for child in (PostLike, Reply, TimelineEntry):
+            child.query.filter_by(post_id=model.id).delete(synchronize_session=False)
+
+
+class RoomAdmin(ModelView):
+    # Room ids are random strings, so rooms are listed by recent activity
+    # with a regular (small table) pager
+    column_display_pk = True
+    column_list = ('id', 'name', 'desc', 'admin', 'post_count', 'last_activity')
+    column_sortable_list = ('last_activity',)
+    column_default_sort = ('last_activity', True)
+    column_filters = (FilterEqual(Room.name, 'Name'),)
+    form_excluded_columns = ('posts', 'members', 'post_count', 'last_activity')
+
+
+class PostLikeAdmin(KeysetModelView):
+    can_create = False
+    can_edit = False
+    column_list = ('id', 'user_id', 'post_id')
+    column_filters = (FilterEqual(PostLike.post_id, 'Post id'),)
+
+    def on_model_delete(self, model):
+        # The ORM deletes the row in this transaction, so adjust the counters
+        # directly; set_like would only queue an unlike when LIKE_BUFFER is on
+        model.post.bump_likes(-1)
+
+
+class ReplyAdmin(KeysetModelView):
+    can_create = False
+    column_list = ('id', 'body', 'timestamp', 'user_id', 'post_id')
+    column_filters = (FilterEqual(Reply.post_id, 'Post id'),)
+    form_columns = ('body',)
+
+    def on_model_delete(self, model):
+        Post.query.filter_by(id=model.post_id).update(
+            {Post.reply_count: Post.reply_count - 1}, synchronize_session='evaluate')
+        mark_changed('post', model.post_id)
+
+
+class AssociationView(BaseView):
+    """Browse and delete rows of a many-to-many table one keyset page at a time.
+
+    ``orders`` lists the column orders that an index covers. Filtering on a
+    column pages in the order that starts with it, so each page is one
+    index range scan.
+    """
+
+    page_size = 50
+
+    def __init__(self, table, orders, **kwargs):
+        self.table = table
+        self.orders = orders
+        super(AssociationView, self).__init__(**kwargs)
+
+    def _coerce(self, column, value):
+        try:
+            return column.type.python_type(value)
+        except ValueError:
+            abort(400)
+
+    @expose('/')
+    def index(self):
+        t = self.table
+        filters = {name: request.args[name] for name in self.orders[0]
+                   if request.args.get(name)}
+        order = next((o for o in self.orders if o[0] in filters), self.orders[0])
+        first, second = t.c[order[0]], t.c[order[1]]
+
+        query = select(t)
+        for name, value in filters.items():
+            query = query.where(t.c[name] == self._coerce(t.c[name], value))
+
+        after = request.args.getlist('after')
+        if len(after) == 2:
+            a, b = self._coerce(first, after[0]), self._coerce(second, after[1])
+            query = query.where(or_(first > a, and_(first == a, second > b)))
+
+        rows = [dict(row._mapping) for row in db.session.execute(
+            query.order_by(first, second).limit(self.page_size))]
+
+        next_url = None
+        if len(rows) == self.page_size:
+            last = rows[-1]
+            next_url = url_for('.index', after=[last[order[0]], last[order[1]]], **filters)
+
+        return self.render('admin/association.html', columns=self.orders[0], rows=rows,
+                           filters=filters, next_url=next_url, estimate=estimate_count(t))
+
+    def remove(self, key):
+        t = self.table
+        db.session.execute(t.delete().where(*[t.c[name] == value for name, value in key.items()]))
+
+    @expose('/delete', methods=['POST'])
+    def delete(self):
+        t = self.table
+        self.remove({name: self._coerce(t.c[name], request.form[name]) for name in self.orders[0]})
+        db.session.commit()
+        return redirect(request.referrer or url_for('.index'))
+
+
+class FollowersView(AssociationView):
+    # Unfollow the way the app does, so profile stats and fan-out timelines follow
+    def remove(self, key):
+        if unfollow_many(key['follower_id'], [key['followed_id']]):
+            get_timeline().on_unfollow(User.query.get(key['follower_id']),
+                                       User.query.get(key['followed_id']))
+
+
+class MembersView(AssociationView):
+    def remove(self, key):
+        super(MembersView, self).remove(key)
+        mark_changed('profile', key['user_id'])
+
+
+admin.add_view(UserAdmin(User, db.session))
+admin.add_view(PostAdmin(Post, db.session))
+admin.add_view(RoomAdmin(Room, db.session))
+admin.add_view(PostLikeAdmin(PostLike, db.session, name='Likes'))
+admin.add_view(ReplyAdmin(Reply, db.session, name='Replies'))
+admin.add_view(MembersView(members, [('user_id', 'room_id'), ('room_id', 'user_id')],
+                           name='Members', endpoint='members'))
+admin.add_view(FollowersView(followers, [('follower_id', 'followed_id'),
+                                         ('followed_id', 'follower_id')],
+                             name='Followers', endpoint='followers'))
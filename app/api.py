@@ -0,0 +1,163 @@
+from hashlib import md5
+from flask import Blueprint, Response, jsonify, request, url_for
+from flask_login import current_user, login_required
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
+from app import app, db, login
+from app.feed import hydrate_posts
+from app.models import User, Post, Room
+from app.pagination import keyset_paginate
+from app.timeline import get_timeline
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def timestamp(value):
+    return value.isoformat() + 'Z' if value else None
+
+
+def user_summary(user):
+    return {'id': user.id, 'username': user.username, 'avatar': user.avatar(60)}
+
+
+def post_dict(post):
+    return {'id': post.id, 'body': post.body, 'timestamp': timestamp(post.timestamp),
+            'author': user_summary(post.author), 'like_count': post.like_count,
+            'liked': post.liked}
+
+
+def post_version(post):
+    return (post.id, post.like_count, post.liked, post.author.username, post.author.avatar_hash)
+
+
+def conditional(payload, version, last_modified=None):
+    """Answer with 304 if the client's copy matches ``version``.
+
+    The ETag is a digest of ``version``, a small tuple of whatever the
+    representation depends on, so a match skips serializing ``payload``.
+    If-None-Match takes precedence over If-Modified-Since, since
+    ``last_modified`` does not move when only a like count changes.
+    """
+    etag = md5(repr(version).encode('utf-8')).hexdigest()
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = jsonify(payload())
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def post_page(query, columns, endpoint, **values):
+    page = keyset_paginate(query, columns, app.config['POSTS_PER_PAGE'],
+                           before=request.args.get('before'), after=request.args.get('after'))
+    posts = hydrate_posts(page.items, current_user)
+
+    def payload():
+        return {
+            'posts': [post_dict(p) for p in posts],
+            'next': url_for(endpoint, before=page.before, **values) if page.before else None,
+            'prev': url_for(endpoint, after=page.after, **values) if page.after else None,
+        }
+
+    version = (page.before, page.after, [post_version(p) for p in posts])
+    return conditional(payload, version, max((p.timestamp for p in posts), default=None))
+
+
+@api.route('/timeline')
+@login_required
+def timeline():
+    timeline = get_timeline()
+    return post_page(timeline.posts(current_user), timeline.order_columns, 'api.timeline')
+
+
+@api.route('/users/<username>')
+@login_required
+def user(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    data = {
+        'id': user.id, 'username': user.username, 'about_me': user.about_me,
+        'avatar': user.avatar(110), 'last_seen': timestamp(user.last_seen),
+        'likes': user.karma, 'followers': user.count_followers(),
+        'following': user.count_following(), 'posts': user.posts.count(),
+        'is_following': current_user.is_following(user),
+    }
+    return conditional(lambda: data, sorted(data.items()))
+
+
+@api.route('/users/<username>/posts')
+@login_required
+def user_posts(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    return post_page(user.posts, (Post.timestamp, Post.id), 'api.user_posts', username=username)
+
+
+@api.route('/rooms')
+@login_required
+def rooms():
+    rooms = sorted(current_user.user_rooms(), key=lambda r: r.name or '')
+    data = [{'id': r.id, 'name': r.name, 'desc': r.desc, 'post_count': r.post_count,
+             'last_activity': timestamp(r.last_activity)} for r in rooms]
+    return conditional(lambda: {'rooms': data}, data)
+
+
+@api.route('/rooms/<id>')
+@login_required
+def room(id):
+    room = Room.query.filter_by(id=id).first_or_404()
+    page = request.args.get('page', 1, type=int)
+    members = room.paginate_members(page, app.config['USERS_PER_PAGE'])
+    data = {
+        'id': room.id, 'name': room.name, 'desc': room.desc, 'admin': room.admin,
+        'post_count': room.post_count, 'last_activity': timestamp(room.last_activity),
+        'member_count': members.total, 'is_member': room.has_member(current_user),
+        'members': [user_summary(u) for u in members.items],
+        'next': url_for('api.room', id=id, page=members.next_num) if members.has_next else None,
+        'prev': url_for('api.room', id=id, page=members.prev_num) if members.has_prev else None,
+    }
+    version = (sorted((k, v) for k, v in data.items() if k != 'members'),
+               [(u.id, u.username, u.avatar_hash) for u in members.items])
+    return conditional(lambda: data, version)
+
+
+@api.route('/rooms/<id>/posts')
+@login_required
+def room_posts(id):
+    room = Room.query.filter_by(id=id).first_or_404()
+    return post_page(room.posts, (Post.timestamp, Post.id), 'api.room_posts', id=id)
+
+
+@api.route('/posts/<int:id>')
+@login_required
+def post(id):
+    post = hydrate_posts([Post.query.get_or_404(id)], current_user)[0]
+    return conditional(lambda: post_dict(post), post_version(post), post.timestamp)
+
+
+@api.route('/posts/<int:id>/like', methods=['PUT', 'DELETE'])
+@login_required
+def like(id):
+    # Both methods are idempotent: liking a liked post or unliking one that
+    # isn't liked leaves everything as it is and returns the same body
+    post = Post.query.get_or_404(id)
+    if request.method == 'PUT':
+        current_user.like_post(post)
+    else:
+        current_user.unlike_post(post)
+    db.session.commit()
+    post = hydrate_posts([post], current_user)[0]
+    return jsonify({'id': post.id, 'like_count': post.like_count, 'liked': post.liked})
+
+
+@api.errorhandler(HTTPException)
+def api_error(error):
+    response = jsonify({'error': error.name, 'message': error.description})
+    response.status_code = error.code
+    return response
+
+
+# Unauthenticated API calls get a 401 rather than a redirect to the login page
+login.blueprint_login_views['api'] = None
+app.register_blueprint(api)
@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import urllib.request
+import click
+from flask import request, send_from_directory, url_for
+from app import app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.map')
+
+# Logical static filename -> fingerprinted filename, from the last build
+manifest = {}
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify(filename, data):
+    # Scripts are copied as they are: even trimming lines would change
+    # multi-line strings and template literals, and gzip/brotli already
+    # take care of the whitespace. Ship pre-minified *.min.js files instead.
+    if filename.endswith('.css') and not filename.endswith('.min.css'):
+        return minify_css(data.decode('utf-8')).encode('utf-8')
+    return data
+
+
+def fingerprint(filename, data):
+    stem, ext = os.path.splitext(filename)
+    return '{}.{}{}'.format(stem, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def vendor(static_dir, sources):
+    """Download third-party files that aren't in ``static_dir`` yet."""
+    fetched = []
+    for filename, url in sources.items():
+        path = os.path.join(static_dir, filename)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=30) as response, open(path + '.tmp', 'wb') as f:
+            shutil.copyfileobj(response, f)
+        os.replace(path + '.tmp', path)
+        fetched.append(filename)
+    return fetched
+
+
+def build(static_dir, dist_dir):
+    """Write minified, fingerprinted and precompressed copies of the static files.
+
+    Each file becomes ``<name>.<hash>.<ext>`` in ``dist_dir``, with ``.gz``
+    and (if the brotli package is installed) ``.br`` variants for text
+    files. Older builds are left in place so pages already cached by
+    browsers still find their assets. Returns the new manifest.
+    """
+    os.makedirs(dist_dir, exist_ok=True)
+    built = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for name in files:
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = minify(filename, f.read())
+
+            hashed = fingerprint(filename, data)
+            target = os.path.join(dist_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+
+            if filename.endswith(COMPRESSIBLE):
+                # mtime=0 keeps the .gz identical between builds
+                variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+                if brotli is not None:
+                    variants.append(('.br', brotli.compress(data)))
+                for suffix, compressed in variants:
+                    if len(compressed) < len(data):
+                        with open(target + suffix, 'wb') as f:
+                            f.write(compressed)
+            built[filename] = hashed
+
+    with open(os.path.join(dist_dir, 'manifest.json'), 'w') as f:
+        json.dump(built, f, indent=2, sort_keys=True)
+    return built
+
+
+def load_manifest():
+    path = os.path.join(app.config['ASSETS_DIR'], 'manifest.json')
+    manifest.clear()
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest.update(json.load(f))
+
+
+def asset_url_for(endpoint, **values):
+    """url_for that sends built static files to their fingerprinted URLs.
+
+    Templates get this as ``url_for``. Static files missing from the
+    manifest keep their plain /static URL, and vendored files that haven't
+    been downloaded yet fall back to where they are vendored from.
+    """
+    if endpoint == 'static':
+        filename = values.get('filename')
+        if filename in manifest:
+            values['filename'] = manifest[filename]
+            return url_for('assets', **values)
+        source = app.config['ASSETS_VENDOR'].get(filename)
+        if source and not os.path.exists(os.path.join(app.static_folder, filename)):
+            return source
+    return url_for(endpoint, **values)
+
+
+@app.route('/assets/<path:filename>')
+def assets(filename):
+    # The name changes whenever the content does, so it can be cached forever
+    dist_dir = app.config['ASSETS_DIR']
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and \
+                os.path.exists(os.path.join(dist_dir, filename + suffix)):
+            response = send_from_directory(dist_dir, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(dist_dir, filename, mimetype=mimetype)
+
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+assets_cli = click.Group('assets', help='Build static assets.')
+
+
+@assets_cli.command('build')
+@click.option('--offline', is_flag=True, help="Don't download missing vendored files.")
+def build_command(offline):
+    """Minify, fingerprint and precompress app/static into ASSETS_DIR."""
+    if not offline:
+        try:
+            for filename in vendor(app.static_folder, app.config['ASSETS_VENDOR']):
+                click.echo('Vendored {}'.format(filename))
+        except OSError as e:
+            raise click.ClickException('Could not download vendored files: {}'.format(e))
+    if brotli is None:
+        click.echo('brotli is not installed, writing .gz variants only.')
+
+    built = build(app.static_folder, app.config['ASSETS_DIR'])
+    manifest.clear()
+    manifest.update(built)
+    click.echo('Built {} assets into {}.'.format(len(built), app.config['ASSETS_DIR']))
+
+
+app.cli.add_command(assets_cli)
+app.jinja_env.globals['url_for'] = asset_url_for
+load_manifest()
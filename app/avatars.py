@@ -0,0 +1,88 @@
+import os
+import re
+import struct
+import zlib
+from flask import Response, abort, send_from_directory
+from app import app, db
+from app.models import User
+
+DIGEST = re.compile(r'^[0-9a-f]{32}$')
+GRID = 5
+
+
+def identicon_pixels(digest):
+    """A symmetric 5x5 grid of on/off cells and a colour, both from the digest."""
+    bits = int(digest, 16)
+    colour = tuple(int(digest[i:i + 2], 16) for i in (0, 2, 4))
+    cells = []
+    for row in range(GRID):
+        left = [(bits >> (row * 3 + col)) & 1 for col in range(3)]
+        cells.append(left + left[1::-1])
+    return cells, colour
+
+
+def encode_png(width, height, rows):
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    raw = b''.join(b'\x00' + bytes(row) for row in rows)
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(raw, 9)),
+        chunk(b'IEND', b''),
+    ])
+
+
+def identicon_png(digest, size):
+    cells, colour = identicon_pixels(digest)
+    background = (240, 240, 240)
+    rows = []
+    for y in range(size):
+        cell_row = cells[min(GRID - 1, y * GRID // size)]
+        row = []
+        for x in range(size):
+            row.extend(colour if cell_row[min(GRID - 1, x * GRID // size)] else background)
+        rows.append(row)
+    return encode_png(size, size, rows)
+
+
+def avatar_path(digest, size):
+    return os.path.join(app.config['AVATAR_DIR'], digest[:2], '{}_{}.png'.format(digest, size))
+
+
+def ensure_avatars(digest):
+    """Generate every configured size for ``digest`` once and keep it on disk."""
+    for size in app.config['AVATAR_SIZES']:
+        path = avatar_path(digest, size)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(identicon_png(digest, size))
+        os.replace(tmp, path)
+
+
+@app.route('/avatar/<digest>/<int:size>')
+def avatar(digest, size):
+    if not DIGEST.match(digest) or size not in app.config['AVATAR_SIZES']:
+        abort(404)
+
+    path = avatar_path(digest, size)
+    if os.path.exists(path):
+        response = send_from_directory(os.path.dirname(path), os.path.basename(path),
+                                       max_age=31536000)
+    elif db.session.query(User.query.filter_by(avatar_hash=digest).exists()).scalar():
+        ensure_avatars(digest)
+        response = send_from_directory(os.path.dirname(path), os.path.basename(path),
+                                       max_age=31536000)
+    else:
+        # Only users' digests are written to disk, so made-up ones are drawn
+        # per request and can't fill AVATAR_DIR
+        response = Response(identicon_png(digest, size), mimetype='image/png')
+
+    # The image is a pure function of the URL, so it can be cached forever
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
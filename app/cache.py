@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+from flask_sqlalchemy import SignallingSession
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from app import app
+from app.models import User, Post, PostLike
+
+
+class LRUCache(object):
+    """Thread-safe in-process cache with LRU eviction and a per-entry TTL.
+
+    Anything with the same get/set/delete methods (a shared cache client,
+    for example) can stand in for it as a FragmentCache backend.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FragmentCache(object):
+    """Rendered post cards and profile stat blocks, invalidated on commit.
+
+    Post cards are keyed on the post and the viewer's like state, and stored
+    with the author's generation token; a username or e-mail change issues a
+    new token, which turns every card by that author into a miss at once.
+    The in-process backend only sees commits from its own worker; other
+    workers rely on the TTL unless a shared backend is used.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _generation(self, user_id):
+        key = 'gen:user:{}'.format(user_id)
+        gen = self.backend.get(key)
+        if gen is None:
+            # A missing token starts a fresh namespace, so an evicted token
+            # can never bring back cards rendered before the last change
+            gen = uuid4().hex[:8]
+            self.backend.set(key, gen)
+        return gen
+
+    def post_card(self, post):
+        if post.pending:
+            # The count includes this viewer's buffered click, which other
+            # viewers must not see until it's written, so don't share it
+            return Markup(app.jinja_env.get_template('_post.html').render(post=post))
+
+        key = 'post:{}:{}'.format(post.id, int(post.liked))
+        gen = self._generation(post.author.id)
+        cached = self.backend.get(key)
+        if cached is not None and cached[0] == gen:
+            return Markup(cached[1])
+
+        html = app.jinja_env.get_template('_post.html').render(post=post)
+        self.backend.set(key, (gen, html))
+        return Markup(html)
+
+    def profile_stats(self, user):
+        key = 'profile:{}'.format(user.id)
+        html = self.backend.get(key)
+        if html is None:
+            html = app.jinja_env.get_template('_profile_stats.html').render(
+                following=user.count_following(), followers=user.count_followers(),
+                rooms=len(user.user_rooms()), num_posts=user.posts.count())
+            self.backend.set(key, html)
+        return Markup(html)
+
+    def invalidate(self, kind, id):
+        if kind == 'post':
+            self.backend.delete('post:{}:0'.format(id))
+            self.backend.delete('post:{}:1'.format(id))
+        elif kind == 'profile':
+            self.backend.delete('profile:{}'.format(id))
+        elif kind == 'author':
+            self.backend.delete('gen:user:{}'.format(id))
+
+
+fragments = FragmentCache(LRUCache(app.config['FRAGMENT_CACHE_SIZE'],
+                                   app.config['FRAGMENT_CACHE_TTL']))
+app.jinja_env.globals['post_card'] = fragments.post_card
+
+
+def _changed(session):
+    return session.info.setdefault('changed', set())
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def collect_fragment_changes(session, flush_context):
+    changed = _changed(session)
+
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Post):
+            changed.add(('post', obj.id))
+            if obj in session.new or obj in session.deleted:
+                changed.add(('profile', obj.user_id))
+        elif isinstance(obj, PostLike):
+            changed.add(('post', obj.post_id))
+        elif isinstance(obj, User):
+            state = inspect(obj)
+            if obj in session.new or obj in session.deleted:
+                changed.add(('author', obj.id))
+                changed.add(('profile', obj.id))
+            elif state.attrs.username.history.has_changes() or \
+                    state.attrs.email.history.has_changes():
+                changed.add(('author', obj.id))
+            if state.attrs.rooms.history.has_changes():
+                changed.add(('profile', obj.id))
+            follows = state.attrs.followed.history
+            if follows.has_changes():
+                changed.add(('profile', obj.id))
+                for other in (follows.added or []) + (follows.deleted or []):
+                    changed.add(('profile', other.id))
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+def apply_fragment_changes(session):
+    for kind, id in session.info.pop('changed', ()):
+        fragments.invalidate(kind, id)
+
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def discard_fragment_changes(session):
+    session.info.pop('changed', None)
@@ -0,0 +1,66 @@
+import click
+from sqlalchemy import func, select, text
+from app import app, db
+from app.models import User, Post, PostLike, Reply, Room
+from app.timeline import SqlTimeline
+from app.search import rebuild_search_index
+from app.tasks import queue
+
+
+@queue.task('rebuild_counters')
+def rebuild_counters():
+    # Set-based rebuild: one correlated UPDATE per table, no rows loaded into Python
+    likes = select(func.count(PostLike.id)).where(
+        PostLike.post_id == Post.id).scalar_subquery()
+    replies = select(func.count(Reply.id)).where(
+        Reply.post_id == Post.id).scalar_subquery()
+    db.session.execute(Post.__table__.update().values(
+        like_count=likes, reply_count=replies))
+
+    karma = select(func.coalesce(func.sum(Post.like_count), 0)).where(
+        Post.user_id == User.id).scalar_subquery()
+    db.session.execute(User.__table__.update().values(karma=karma))
+
+    room_posts = select(func.count(Post.id)).where(Post.room_id == Room.id).scalar_subquery()
+    room_activity = select(func.max(Post.timestamp)).where(Post.room_id == Room.id).scalar_subquery()
+    db.session.execute(Room.__table__.update().values(
+        post_count=room_posts, last_activity=room_activity))
+    db.session.commit()
+
+
+@app.cli.command()
+@click.option('--background', is_flag=True, help='Queue the rebuild for a worker instead.')
+def recount(background):
+    """Rebuild post like/reply counts, user karma and room activity."""
+    if background:
+        queue.enqueue('rebuild_counters')
+        db.session.commit()
+        click.echo('Queued a counter rebuild.')
+        return
+    rebuild_counters()
+    click.echo('Rebuilt like, reply and karma counters.')
+
+
+@app.cli.command('rebuild-timelines')
+def rebuild_timelines():
+    """Refill the timeline table from the followers graph."""
+    timeline = SqlTimeline(app.config['TIMELINE_MAX_LENGTH'])
+    for user in User.query.yield_per(500):
+        timeline.rebuild(user)
+    db.session.commit()
+    click.echo('Rebuilt home timelines.')
+
+
+@app.cli.command()
+def reindex():
+    """Rebuild the full-text search index for users, posts and rooms."""
+    rebuild_search_index()
+    click.echo('Rebuilt search index.')
+
+
+@app.cli.command()
+def analyze():
+    """Refresh planner statistics, which also feed admin row estimates."""
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+    click.echo('Analyzed database.')
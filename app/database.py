@@ -0,0 +1,14 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if type(dbapi_connection).__module__ != 'sqlite3':
+        return
+
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+    cursor.close()
@@ -0,0 +1,41 @@
+from collections import namedtuple
+from app import db
+from app.models import User, PostLike
+from app.likes import pending_likes
+
+# What _post.html needs to render a post card, with nothing left to lazy load.
+# ``pending`` is set when the viewer's unwritten like click changed the card.
+FeedPost = namedtuple('FeedPost', ['id', 'body', 'timestamp', 'author', 'like_count',
+                                   'reply_count', 'liked', 'pending'])
+
+
+def hydrate_posts(posts, viewer):
+    """Turn a page of posts into FeedPosts using two bulk queries.
+
+    Authors and the viewer's liked-set are fetched for the whole page at once
+    and like/reply counts come from the post's counter columns, so rendering
+    cost doesn't depend on POSTS_PER_PAGE.
+    """
+    posts = list(posts)
+    if not posts:
+        return []
+
+    post_ids = [p.id for p in posts]
+    user_ids = {p.user_id for p in posts}
+
+    authors = {u.id: u for u in User.query.filter(User.id.in_(user_ids))}
+
+    liked, pending = set(), {}
+    if viewer.is_authenticated:
+        liked = {row.post_id for row in db.session.query(PostLike.post_id).filter(
+            PostLike.user_id == viewer.id, PostLike.post_id.in_(post_ids))}
+        # The viewer's own buffered like clicks, not written yet
+        pending = pending_likes(viewer.id, post_ids)
+
+    feed = []
+    for p in posts:
+        stored = p.id in liked
+        now = pending.get(p.id, stored)
+        feed.append(FeedPost(p.id, p.body, p.timestamp, authors.get(p.user_id),
+                             p.like_count + now - stored, p.reply_count, now, now != stored))
+    return feed
@@ -1,4 +1,5 @@
 from typing import Text
+from flask import request
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField
 from wtforms import validators
@@ -74,4 +75,12 @@ class ReplyForm(FlaskForm):
     submit = SubmitField('Submit Reply')
 
 class SearchForm(FlaskForm):
-    username = TextField('Search User', render_kw={"placeholder": "Username"})
\ No newline at end of file
+    q = StringField('Search', validators=[DataRequired()], render_kw={"placeholder": "Search loungr"})
+
+    # Submitted with GET so results pages can be linked and paginated
+    def __init__(self, *args, **kwargs):
+        if 'formdata' not in kwargs:
+            kwargs['formdata'] = request.args
+        if 'meta' not in kwargs:
+            kwargs['meta'] = {'csrf': False}
+        super(SearchForm, self).__init__(*args, **kwargs)
\ No newline at end of file
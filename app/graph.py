@@ -0,0 +1,83 @@
+from sqlalchemy import and_, exists, func, literal, select
+from app import db
+from app.models import User, followers, mark_changed
+
+# Each function below is a single statement. Forward lookups (who does X
+# follow) use the (follower_id, followed_id) primary key and reverse lookups
+# (who follows X) use ix_followers_followed_follower.
+
+
+def edge_exists(follower_id, followed_id):
+    return exists().where(followers.c.follower_id == follower_id,
+                          followers.c.followed_id == followed_id)
+
+
+def is_following(follower_id, followed_id):
+    return db.session.query(edge_exists(follower_id, followed_id)).scalar()
+
+
+def following_ids(follower_id, user_ids):
+    """The subset of ``user_ids`` that ``follower_id`` follows."""
+    if not user_ids:
+        return set()
+    return {row.followed_id for row in db.session.query(followers.c.followed_id).filter(
+        followers.c.follower_id == follower_id, followers.c.followed_id.in_(user_ids))}
+
+
+def follow_many(follower_id, user_ids):
+    """Follow every existing user in ``user_ids`` not already followed.
+
+    Returns the number of new edges. Timelines are not touched; callers
+    using a fan-out backend should update or rebuild them.
+    """
+    user_ids = set(user_ids) - {follower_id}
+    if not user_ids:
+        return 0
+    result = db.session.execute(followers.insert().from_select(
+        ['follower_id', 'followed_id'],
+        select(literal(follower_id), User.id).where(
+            User.id.in_(user_ids), ~edge_exists(follower_id, User.id))))
+    _mark_profiles(follower_id, user_ids)
+    return result.rowcount
+
+
+def unfollow_many(follower_id, user_ids):
+    user_ids = set(user_ids)
+    if not user_ids:
+        return 0
+    result = db.session.execute(followers.delete().where(
+        followers.c.follower_id == follower_id, followers.c.followed_id.in_(user_ids)))
+    _mark_profiles(follower_id, user_ids)
+    return result.rowcount
+
+
+def _mark_profiles(follower_id, user_ids):
+    # Follower and following counts on both sides change
+    mark_changed('profile', follower_id)
+    for id in user_ids:
+        mark_changed('profile', id)
+
+
+def mutual_follows(user_id):
+    """Users that ``user_id`` follows and who follow them back, by username."""
+    out, back = followers.alias('out'), followers.alias('back')
+    return User.query.join(out, and_(out.c.follower_id == user_id,
+                                     out.c.followed_id == User.id)).join(
+        back, and_(back.c.follower_id == User.id, back.c.followed_id == user_id)).order_by(
+        User.username)
+
+
+def suggestions(user_id, limit=10):
+    """Users followed by people ``user_id`` follows, but not by ``user_id``.
+
+    Returns (User, score) rows, where score is how many of the people
+    ``user_id`` follows already follow that user.
+    """
+    mine, theirs = followers.alias('mine'), followers.alias('theirs')
+    score = func.count().label('score')
+    return db.session.query(User, score).join(
+        theirs, theirs.c.followed_id == User.id).join(
+        mine, mine.c.followed_id == theirs.c.follower_id).filter(
+        mine.c.follower_id == user_id, User.id != user_id,
+        ~edge_exists(user_id, User.id)).group_by(User.id).order_by(
+        score.desc(), User.id).limit(limit).all()
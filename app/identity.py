@@ -0,0 +1,106 @@
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
+from app import app, login
+from app.cache import LRUCache
+from app.models import User
+
+
+class CachedUser(object):
+    """The logged-in user as a snapshot of a cached ``user`` row.
+
+    Methods that only need the user's id are borrowed from User and run
+    without loading it. Anything else (relationships, other methods) loads
+    the real User once per request and is looked up on it. The snapshot is
+    read-only: write to ``User.query.get(current_user.id)`` instead.
+    """
+
+    FIELDS = ('id', 'username', 'email', 'avatar_hash', 'about_me', 'last_seen')
+    __slots__ = FIELDS + ('_user',)
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    avatar = User.avatar
+    is_following = User.is_following
+    follow = User.follow
+    unfollow = User.unfollow
+    has_liked_post = User.has_liked_post
+    like_post = User.like_post
+    unlike_post = User.unlike_post
+    reply_to = User.reply_to
+
+    def __init__(self, row, user=None):
+        for field, value in zip(self.FIELDS, row):
+            object.__setattr__(self, field, value)
+        object.__setattr__(self, '_user', user)
+
+    @classmethod
+    def row(cls, user):
+        return tuple(getattr(user, field) for field in cls.FIELDS)
+
+    def get_id(self):
+        return str(self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._user is None:
+            object.__setattr__(self, '_user', User.query.get(self.id))
+        return getattr(self._user, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is a read-only snapshot'.format(self))
+
+    def __eq__(self, other):
+        get_id = getattr(other, 'get_id', None)
+        return get_id is not None and self.get_id() == get_id()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return '<CachedUser {}>'.format(self.username)
+
+
+identities = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+
+@login.user_loader
+def load_user(id):
+    id = int(id)
+    row = identities.get(id)
+    if row is not None:
+        return CachedUser(row)
+
+    user = User.query.get(id)
+    if user is None:
+        return None
+    identities.set(id, CachedUser.row(user))
+    return CachedUser(CachedUser.row(user), user)
+
+
+# Other workers only see a change once their entry's TTL runs out. last_seen
+# and karma are written by bulk UPDATEs and are deliberately not tracked:
+# last_seen in the snapshot is only used to decide whether to touch it again.
+
+@event.listens_for(SignallingSession, 'after_flush')
+def collect_user_changes(session, flush_context):
+    for obj in session.dirty | session.deleted:
+        if isinstance(obj, User) and (obj in session.deleted or
+                                      session.is_modified(obj, include_collections=False)):
+            session.info.setdefault('users', set()).add(obj.id)
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+def evict_changed_users(session):
+    for id in session.info.pop('users', ()):
+        identities.delete(id)
+
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def discard_user_changes(session):
+    session.info.pop('users', None)
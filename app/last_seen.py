@@ -0,0 +1,81 @@
+import atexit
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam
+from app import app, db
+from app.models import User
+
+
+class LastSeenTracker(object):
+    """Buffers last_seen timestamps per process and writes them in batches.
+
+    A touch is dropped when the stored value, or the one this process last
+    wrote, is already within ``granularity`` of now. Pending timestamps are
+    written in one executemany UPDATE ``flush_interval`` seconds after the
+    first of them, or as soon as ``flush_size`` users are waiting.
+    """
+
+    def __init__(self, granularity, flush_interval, flush_size):
+        self.granularity = timedelta(seconds=granularity)
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.pending = {}
+        # The previous batch, for callers whose user.last_seen is a cached copy
+        self.flushed = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def touch(self, user, now=None):
+        now = now or datetime.utcnow()
+        if user.last_seen is not None and now - user.last_seen < self.granularity:
+            return
+
+        with self._lock:
+            seen = self.pending.get(user.id) or self.flushed.get(user.id)
+            if seen is not None and now - seen < self.granularity:
+                return
+            self.pending[user.id] = now
+            due = len(self.pending) >= self.flush_size
+            if not due and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self.flushed = pending
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not pending:
+            return
+
+        # Own connection and transaction, so the request's session is untouched
+        stmt = User.__table__.update().where(
+            User.__table__.c.id == bindparam('uid')).values(last_seen=bindparam('seen'))
+        with db.engine.begin() as conn:
+            conn.execute(stmt, [{'uid': uid, 'seen': seen} for uid, seen in pending.items()])
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            app.logger.exception('Could not flush last_seen updates')
+
+
+last_seen = LastSeenTracker(app.config['LAST_SEEN_GRANULARITY'],
+                            app.config['LAST_SEEN_FLUSH_INTERVAL'],
+                            app.config['LAST_SEEN_FLUSH_SIZE'])
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        last_seen.flush()
+    except Exception:
+        app.logger.exception('Could not flush last_seen updates on exit')
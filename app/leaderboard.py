@@ -0,0 +1,42 @@
+from sqlalchemy import func
+from app import db
+from app.models import User, followers, members
+
+# Columns the leaderboard can be ordered by
+SORT_KEYS = ('likes', 'followers', 'following', 'rooms')
+DEFAULT_SORT = 'likes'
+
+
+def _grouped_count(key, count_col):
+    # One GROUP BY per metric, keyed on the user id it belongs to
+    return db.session.query(
+        key.label('user_id'),
+        func.count(count_col).label('n')).group_by(key).subquery()
+
+
+def leaderboard_query(sort=DEFAULT_SORT):
+    """Every user with likes, followers, following and room counts attached.
+
+    Likes come from the denormalized ``user.karma`` column and the rest from
+    grouped subqueries outer-joined onto ``user``, so a page of the
+    leaderboard is a single SELECT however many users there are.
+    """
+    if sort not in SORT_KEYS:
+        sort = DEFAULT_SORT
+
+    followers_n = _grouped_count(followers.c.followed_id, followers.c.follower_id)
+    following_n = _grouped_count(followers.c.follower_id, followers.c.followed_id)
+    rooms_n = _grouped_count(members.c.user_id, members.c.room_id)
+
+    metrics = {
+        'likes': User.karma.label('likes'),
+        'followers': func.coalesce(followers_n.c.n, 0).label('followers'),
+        'following': func.coalesce(following_n.c.n, 0).label('following'),
+        'rooms': func.coalesce(rooms_n.c.n, 0).label('rooms'),
+    }
+
+    return db.session.query(User, *metrics.values()) \
+        .outerjoin(followers_n, followers_n.c.user_id == User.id) \
+        .outerjoin(following_n, following_n.c.user_id == User.id) \
+        .outerjoin(rooms_n, rooms_n.c.user_id == User.id) \
+        .order_by(metrics[sort].desc(), User.id)
@@ -0,0 +1,168 @@
+import atexit
+import threading
+from sqlalchemy import bindparam, exists, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import app, db
+from app.cache import fragments
+from app.models import User, Post, PostLike
+
+likes_table = PostLike.__table__
+posts_table = Post.__table__
+users_table = User.__table__
+
+
+def insert_like(dialect=None):
+    """INSERT of one (uid, pid) like that does nothing if it already exists.
+
+    ``dialect`` defaults to that of the app's engine.
+    """
+    values = {'user_id': bindparam('uid'), 'post_id': bindparam('pid')}
+    dialect = dialect or db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(likes_table).values(values).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(likes_table).values(values).on_conflict_do_nothing()
+    return likes_table.insert().values(values).prefix_with('IGNORE', dialect='mysql')
+
+
+def delete_like():
+    return likes_table.delete().where(likes_table.c.user_id == bindparam('uid'),
+                                      likes_table.c.post_id == bindparam('pid'))
+
+
+def set_like(user_id, post, liked):
+    """Like or unlike ``post``; repeating either is a no-op.
+
+    The rowcount of the insert or delete says whether anything changed, so
+    counters move only when a row really did, even if clicks race.
+    """
+    if like_buffer is not None:
+        like_buffer.toggle(user_id, post.id, liked)
+        return
+    stmt = insert_like() if liked else delete_like()
+    if db.session.execute(stmt, {'uid': user_id, 'pid': post.id}).rowcount:
+        post.bump_likes(1 if liked else -1)
+
+
+def has_liked(user_id, post_id):
+    pending = pending_likes(user_id, [post_id])
+    if post_id in pending:
+        return pending[post_id]
+    return db.session.query(exists().where(
+        PostLike.user_id == user_id, PostLike.post_id == post_id)).scalar()
+
+
+def pending_likes(user_id, post_ids):
+    """{post_id: liked} for ``user_id``'s clicks that are not written yet."""
+    if like_buffer is None:
+        return {}
+    return like_buffer.state(user_id, post_ids)
+
+
+class LikeBuffer(object):
+    """Coalesces like/unlike clicks per process and writes them in batches.
+
+    Only the latest state of each (user, post) pair is kept, so toggling
+    back and forth before a flush costs nothing. A batch is one transaction
+    on its own connection: an insert-or-ignore or delete per pair, then one
+    executemany counter UPDATE for the posts and their authors. Batches are
+    written ``flush_interval`` seconds after the first click in them, or as
+    soon as ``flush_size`` pairs are waiting.
+    """
+
+    def __init__(self, flush_interval, flush_size):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.pending = {}
+        # The batch being written, still visible to state() until committed
+        self.flushing = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def toggle(self, user_id, post_id, liked):
+        with self._lock:
+            self.pending[(user_id, post_id)] = liked
+            due = len(self.pending) >= self.flush_size
+            if not due and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def state(self, user_id, post_ids):
+        with self._lock:
+            state = {}
+            for pid in post_ids:
+                key = (user_id, pid)
+                if key in self.pending:
+                    state[pid] = self.pending[key]
+                elif key in self.flushing:
+                    state[pid] = self.flushing[key]
+            return state
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self.pending = self.pending, {}
+                self.flushing = pending
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not pending:
+                return
+
+            try:
+                deltas = self._write(pending)
+            except Exception:
+                # Keep the clicks for the next flush unless newer ones replaced them
+                with self._lock:
+                    for key, liked in pending.items():
+                        self.pending.setdefault(key, liked)
+                raise
+            finally:
+                with self._lock:
+                    self.flushing = {}
+
+        for pid in deltas:
+            fragments.invalidate('post', pid)
+
+    def _write(self, pending):
+        deltas = {}
+        insert, delete = insert_like(), delete_like()
+        with db.engine.begin() as conn:
+            for (uid, pid), liked in pending.items():
+                if conn.execute(insert if liked else delete, {'uid': uid, 'pid': pid}).rowcount:
+                    deltas[pid] = deltas.get(pid, 0) + (1 if liked else -1)
+
+            params = [{'pid': pid, 'n': n} for pid, n in deltas.items() if n]
+            if params:
+                conn.execute(posts_table.update().where(
+                    posts_table.c.id == bindparam('pid')).values(
+                    like_count=posts_table.c.like_count + bindparam('n')), params)
+                author = select(posts_table.c.user_id).where(
+                    posts_table.c.id == bindparam('pid')).scalar_subquery()
+                conn.execute(users_table.update().where(users_table.c.id == author).values(
+                    karma=users_table.c.karma + bindparam('n')), params)
+        return deltas
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            app.logger.exception('Could not flush buffered likes')
+
+
+like_buffer = LikeBuffer(app.config['LIKE_FLUSH_INTERVAL'],
+                         app.config['LIKE_FLUSH_SIZE']) if app.config['LIKE_BUFFER'] else None
+
+
+@atexit.register
+def _flush_on_exit():
+    if like_buffer is None:
+        return
+    try:
+        like_buffer.flush()
+    except Exception:
+        app.logger.exception('Could not flush buffered likes on exit')
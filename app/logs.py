@@ -0,0 +1,92 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from uuid import uuid4
+from flask import g, request, has_request_context, _request_ctx_stack
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the request id, user id and route.
+
+    Runs on the request thread (it's attached to the QueueHandler), which is
+    the only place the request context is available.
+    """
+
+    def filter(self, record):
+        record.request_id = record.user_id = record.route = None
+        if has_request_context():
+            if 'request_id' not in g:
+                g.request_id = request.headers.get('X-Request-ID') or uuid4().hex
+            record.request_id = g.request_id
+            record.route = request.endpoint
+            # Only read a user flask_login has already loaded; never trigger a query
+            user = getattr(_request_ctx_stack.top, 'user', None)
+            record.user_id = getattr(user, 'id', None)
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """A QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() runs the handler's formatter on the calling thread
+    and folds any traceback into ``msg``. Here only the message is resolved
+    (its args may change after the call returns); exc_info stays on the
+    record for the listener's formatter.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'user_id': getattr(record, 'user_id', None),
+            'route': getattr(record, 'route', None),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry)
+
+
+def configure_logging(config):
+    """Route all logging through a queue to a background file writer.
+
+    Request threads only enqueue records; a QueueListener thread formats them
+    as JSON lines and writes them to a size-rotated file.
+    """
+    log_queue = queue.Queue(-1)
+
+    file_handler = RotatingFileHandler(config.LOG_FILE, maxBytes=config.LOG_MAX_BYTES,
+                                       backupCount=config.LOG_BACKUP_COUNT)
+    file_handler.setFormatter(JsonFormatter())
+
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(config.LOG_LEVEL)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
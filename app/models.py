@@ -1,35 +1,58 @@
 from datetime import datetime
 from enum import unique
-from werkzeug.security import generate_password_hash, check_password_hash
-from app import db, login
+from app import db
+from app.passwords import passwords
+from flask import url_for
 from flask_login import UserMixin
 from hashlib import md5
 from uuid import uuid4
+from sqlalchemy.orm import validates
+
+
+def mark_changed(kind, id):
+    # Records rows changed by bulk UPDATE/DELETE statements, which the ORM
+    # doesn't track, for after_commit listeners such as the fragment cache
+    db.session.info.setdefault('changed', set()).add((kind, id))
+
 
 followers = db.Table('followers',
-    db.Column('follower_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('follower_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Index('ix_followers_followed_follower', 'followed_id', 'follower_id')
 )
 
 # USER <-> ROOM RELATIONSHIP
 members = db.Table('members', db.Model.metadata,
     db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('room_id', db.String(8), db.ForeignKey('room.id'))
+    db.Column('room_id', db.String(8), db.ForeignKey('room.id')),
+    db.UniqueConstraint('user_id', 'room_id', name='uq_members_user_room'),
+    db.Index('ix_members_room_user', 'room_id', 'user_id')
 )
 # POST <-> USER RELATIONSHIP
 
+def email_digest(email):
+    return md5(email.strip().lower().encode('utf-8')).hexdigest() if email else None
+
+
 # USER <-> LIKE RELATIONSHIP
 class PostLike(db.Model):
     __tablename__ = 'post_like'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    post_id = db.Column(db.Integer, db.ForeignKey('post.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), index=True, nullable=False)
+
+    # One like per user and post; app/likes.py inserts with ON CONFLICT DO NOTHING
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='uq_post_like_user_post'),
+    )
 
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
     email = db.Column(db.String(120), index=True, unique=True)
+    # md5 of the lower-cased e-mail, kept in step by validate_email
+    avatar_hash = db.Column(db.String(32), index=True)
     password_hash = db.Column(db.String(128))
 
     posts = db.relationship('Post', backref='author', lazy='dynamic')
@@ -38,6 +61,9 @@ class User(UserMixin, db.Model):
     about_me = db.Column(db.String(140))    
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Total likes across this user's posts, kept up to date by like_post/unlike_post
+    karma = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
     followed = db.relationship(
         'User', secondary = followers,
         primaryjoin = (followers.c.follower_id == id),
@@ -49,50 +75,60 @@ class User(UserMixin, db.Model):
     foreign_keys='PostLike.user_id',
     backref='user', lazy='dynamic')
 
-    rooms = db.relationship('Room', secondary=members)
+    rooms = db.relationship('Room', secondary=members,
+        backref=db.backref('members', lazy='dynamic'))
 
+    # Likes go through app.likes: one idempotent statement per click, or a
+    # per-process buffer when LIKE_BUFFER is on
     def like_post(self, post):
-        if not self.has_liked_post(post):
-            like = PostLike(user_id=self.id, post_id=post.id)
-            db.session.add(like)
+        from app.likes import set_like
+        set_like(self.id, post, True)
 
     def no_likes(self):
-        ps = self.posts
-        l = 0
-
-        for p in ps:
-            l += p.likes.count()
-        
-        return l
+        return self.karma
 
     def unlike_post(self, post):
-        if self.has_liked_post(post):
-            PostLike.query.filter_by(
-                user_id=self.id,
-                post_id=post.id).delete()
+        from app.likes import set_like
+        set_like(self.id, post, False)
+
+    def reply_to(self, post, body):
+        reply = Reply(body=body, user_id=self.id, post_id=post.id)
+        db.session.add(reply)
+        Post.query.filter_by(id=post.id).update(
+            {Post.reply_count: Post.reply_count + 1}, synchronize_session='evaluate')
+        mark_changed('post', post.id)
+        return reply
 
     def has_liked_post(self, post):
-        return PostLike.query.filter(
-            PostLike.user_id == self.id,
-            PostLike.post_id == post.id).count() > 0
+        from app.likes import has_liked
+        return has_liked(self.id, post.id)
 
+    # Hashing runs in app.passwords' process pool and can raise
+    # PasswordServiceBusy, which is a 503
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+
+    @validates('email')
+    def validate_email(self, key, email):
+        self.avatar_hash = email_digest(email)
+        return email
 
     def avatar(self, size):
-        digest = md5(self.email.lower().encode('utf-8')).hexdigest()
-        return 'https://www.gravatar.com/avatar/{}?d=identicon&s={}'.format(digest, size)
+        digest = self.avatar_hash or email_digest(self.email)
+        return url_for('avatar', digest=digest, size=size)
 
+    # Follows go through app.graph, which writes the association table
+    # directly instead of loading self.followed
     def follow(self, user):
-        if not self.is_following(user):
-            self.followed.append(user)
+        from app.graph import follow_many
+        follow_many(self.id, [user.id])
 
     def unfollow(self, user):
-        if self.is_following(user):
-            self.followed.remove(user)
+        from app.graph import unfollow_many
+        unfollow_many(self.id, [user.id])
 
     def count_following(self):
         return self.followed.count()
@@ -113,26 +149,26 @@ class User(UserMixin, db.Model):
 
 
     def is_following(self, user):
-        # Should return a bool
-        return user in self.followed
+        from app.graph import is_following
+        return is_following(self.id, user.id)
 
     def followed_posts(self):
         followed = Post.query.join(
             followers, (followers.c.followed_id == Post.user_id)).filter(
                 followers.c.follower_id == self.id)
         own = Post.query.filter_by(user_id=self.id)
-        return followed.union(own).order_by(Post.timestamp.desc())
+        return followed.union(own).order_by(Post.timestamp.desc(), Post.id.desc())
 
     def __repr__(self):
         return '<User {}>'.format(self.username)
 
 
     def join_room(self, room):
-        if room not in self.rooms:
+        if not room.has_member(self):
             self.rooms.append(room)
 
     def leave_room(self, room):
-        if room in self.rooms:
+        if room.has_member(self):
             self.rooms.remove(room)
 
     def user_rooms(self):
@@ -145,14 +181,34 @@ class Post(db.Model):
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
-    # NOT USED
+    # Set for posts made inside a room, see Post.set_room
     room_id = db.Column(db.String(8), db.ForeignKey('room.id'))
 
     likes = db.relationship('PostLike', backref='post', lazy='dynamic')
     replies = db.relationship('Reply', backref='reply', lazy='dynamic')
 
+    # Denormalized counters, rebuilt from post_like/reply by `flask recount`
+    like_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    reply_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_post_user_timestamp', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_post_room_timestamp', 'room_id', 'timestamp', 'id'),
+    )
+
     def set_room(self, room):
-        self.room_id = room
+        if self.timestamp is None:
+            self.timestamp = datetime.utcnow()
+        self.room_id = room.id
+        room.record_post(self.timestamp)
+
+    def bump_likes(self, n):
+        # Increment in SQL so concurrent likes on the same post don't lose updates
+        Post.query.filter_by(id=self.id).update(
+            {Post.like_count: Post.like_count + n}, synchronize_session='evaluate')
+        User.query.filter_by(id=self.user_id).update(
+            {User.karma: User.karma + n}, synchronize_session='evaluate')
+        mark_changed('post', self.id)
 
     def __repr__(self):
         return '<Post {}>'.format(self.body)
@@ -165,7 +221,18 @@ class Reply(db.Model):
 
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'))
 
-    
+    __table_args__ = (
+        db.Index('ix_reply_post_timestamp', 'post_id', 'timestamp', 'id'),
+    )
+
+    @staticmethod
+    def thread(post):
+        # Authors come back in the same query, so a page of replies is one SELECT
+        return Reply.query.filter_by(post_id=post.id).options(db.joinedload(Reply.author))
+
+    def __repr__(self):
+        return '<Reply {}>'.format(self.body)
+
 
 # TO IMPLEMENT
 class Room(db.Model):
@@ -175,6 +242,12 @@ class Room(db.Model):
     admin = db.Column(db.Integer)
     # https://stackoverflow.com/questions/13484726/safe-enough-8-character-short-unique-random-string
 
+    posts = db.relationship('Post', backref='room', lazy='dynamic')
+
+    # Maintained by record_post and rebuilt by `flask recount`
+    post_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    last_activity = db.Column(db.DateTime, index=True)
+
     def new_room(self, user):
         # Generate short room code
         code = str(uuid4())[:8]
@@ -190,22 +263,67 @@ class Room(db.Model):
 
 
     def get_members(self):
-        users = User.query.all()
-        correct = []
+        return self.members.order_by(User.username).all()
+
+    def paginate_members(self, page, per_page):
+        return self.members.order_by(User.username).paginate(page, per_page, False)
+
+    def count_members(self):
+        return db.session.query(members).filter(
+            members.c.room_id == self.id).count()
+
+    def has_member(self, user):
+        return db.session.query(members).filter(
+            members.c.room_id == self.id,
+            members.c.user_id == user.id).count() > 0
 
-        for user in users:
-            if self in user.rooms:
-                correct.append(user)
-        
-        return correct
+    def record_post(self, timestamp):
+        Room.query.filter_by(id=self.id).update(
+            {Room.post_count: Room.post_count + 1, Room.last_activity: timestamp},
+            synchronize_session='evaluate')
 
+    @staticmethod
+    def by_activity():
+        return Room.query.order_by(Room.last_activity.desc().nullslast(), Room.name)
 
 
     def __repr__(self):
         return '<Room {}>'.format(self.id)
 
 
+# MATERIALIZED HOME TIMELINE, only written when TIMELINE_BACKEND = 'sql'
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    timestamp = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_timeline_user_timestamp', 'user_id', 'timestamp'),
+    )
+
+
+# DURABLE BACKGROUND JOBS, see app/tasks.py
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64))
+    payload = db.Column(db.Text)
+    # queued -> running -> deleted on success, or back to queued until
+    # max_attempts is reached and it is left as failed
+    status = db.Column(db.String(16), default='queued', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    def __repr__(self):
+        return '<Job {} {}>'.format(self.id, self.name)
+
 
-@login.user_loader
-def load_user(id):
-    return User.query.get(int(id))
\ No newline at end of file
+# The login user_loader lives in app/identity.py, which caches users per process
@@ -0,0 +1,59 @@
+import base64
+import binascii
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+# items: the rows on this page, newest first. before/after: cursors for the
+# next (older) and previous (newer) pages, or None at either end.
+KeysetPage = namedtuple('KeysetPage', ['items', 'before', 'after'])
+
+
+def encode_cursor(timestamp, id):
+    raw = '{}|{}'.format(timestamp.isoformat(), id)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+        timestamp, id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def keyset_paginate(query, columns, per_page, before=None, after=None):
+    """Page through ``query`` newest-first on a (timestamp, id) key.
+
+    ``columns`` are the timestamp and id columns to seek on; they should be
+    covered by an index so every page costs the same as the first. Items must
+    expose ``timestamp`` and ``id`` so cursors can be built from them.
+    """
+    ts_col, id_col = columns
+    query = query.order_by(None)
+    before, after = decode_cursor(before), decode_cursor(after)
+
+    if after is not None:
+        ts, id = after
+        rows = query.filter(or_(ts_col > ts, and_(ts_col == ts, id_col > id))) \
+            .order_by(ts_col.asc(), id_col.asc()).limit(per_page + 1).all()
+        has_newer, has_older = len(rows) > per_page, True
+        items = list(reversed(rows[:per_page]))
+    else:
+        if before is not None:
+            ts, id = before
+            query = query.filter(or_(ts_col < ts, and_(ts_col == ts, id_col < id)))
+        rows = query.order_by(ts_col.desc(), id_col.desc()).limit(per_page + 1).all()
+        has_newer, has_older = before is not None, len(rows) > per_page
+        items = rows[:per_page]
+
+    if not items:
+        return KeysetPage([], None, None)
+
+    return KeysetPage(
+        items,
+        encode_cursor(items[-1].timestamp, items[-1].id) if has_older else None,
+        encode_cursor(items[0].timestamp, items[0].id) if has_newer else None)
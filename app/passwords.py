@@ -0,0 +1,99 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+from app import app
+
+
+class PasswordServiceBusy(ServiceUnavailable):
+    description = 'Too many sign-ins at once, please try again in a moment.'
+
+
+class PasswordService(object):
+    """Hashes and verifies passwords outside the request thread.
+
+    Work goes to a pool of spawned processes (forking would copy the app's
+    threads and open connections into them), so a burst of logins uses at
+    most ``workers`` cores. Callers still wait for the result, but no more
+    than ``queue_limit`` hashes may be pending at once and none for longer
+    than ``timeout`` seconds; past either limit PasswordServiceBusy is raised.
+    A ``queue_limit`` of 0 or None means no limit on pending hashes.
+    """
+
+    def __init__(self, algorithm, rounds, salt_length=16, workers=1, queue_limit=32, timeout=5):
+        self.method = '{}:{}'.format(algorithm, rounds)
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_limit) if queue_limit else None
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['PASSWORD_HASH_ALGORITHM'], config['PASSWORD_HASH_ROUNDS'],
+                   config['PASSWORD_SALT_LENGTH'], config['PASSWORD_WORKERS'],
+                   config['PASSWORD_QUEUE_LIMIT'], config['PASSWORD_TIMEOUT'])
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _call(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            raise PasswordServiceBusy(retry_after=1)
+
+        try:
+            future = self._executor().submit(fn, *args)
+        except BrokenProcessPool:
+            self._release()
+            self._reset()
+            raise PasswordServiceBusy(retry_after=1)
+        future.add_done_callback(lambda f: self._release())
+
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordServiceBusy(retry_after=self.timeout)
+        except BrokenProcessPool:
+            self._reset()
+            raise PasswordServiceBusy(retry_after=1)
+
+    def _release(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def _reset(self):
+        # A worker died and the pool can't be used again; start a new one
+        # on the next call
+        app.logger.exception('Password hashing pool broke')
+        with self._lock:
+            self._pool = None
+
+    def hash(self, password):
+        return self._call(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._call(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return bool(pwhash) and pwhash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+passwords = PasswordService.from_config(app.config)
@@ -0,0 +1,154 @@
+import re
+import threading
+import time
+from collections import Counter
+from flask import g, has_request_context, request, request_started, request_finished, \
+    before_render_template, template_rendered
+from flask_admin import BaseView, expose
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def fingerprint(statement):
+    # Collapse whitespace, literals and IN lists so repeats of one query match
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    statement = re.sub(r"'[^']*'|\b\d+\b", '?', statement)
+    return re.sub(r'\((?:\?, )+\?\)', '(?)', statement)
+
+
+class RequestProfile(object):
+    __slots__ = ('queries', 'sql_time', 'render_time', 'statements', '_render_start')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+        self._render_start = None
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.suspects = Counter()
+
+    def add(self, profile, suspects):
+        self.requests += 1
+        self.queries += profile.queries
+        self.max_queries = max(self.max_queries, profile.queries)
+        self.sql_time += profile.sql_time
+        self.render_time += profile.render_time
+        self.suspects.update(suspects)
+
+
+class Profiler(object):
+    """Per-request SQL and render timings, with N+1 detection.
+
+    A statement fingerprint executed ``threshold`` or more times in one
+    request is reported as a likely N+1.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, admin=None):
+        if self.app is not None:
+            return
+        self.app = app
+        self.threshold = app.config['PROFILER_N_PLUS_ONE_THRESHOLD']
+
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        request_started.connect(self._request_started, app)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        request_finished.connect(self._request_finished, app)
+
+        if admin is not None:
+            admin.add_view(ProfilerView(self, name='Profiler', endpoint='profiler'))
+
+    def remove_app(self):
+        # Undoes init_app, except for the admin view, which can't be removed
+        if self.app is None:
+            return
+        event.remove(Engine, 'before_cursor_execute', self._before_execute)
+        event.remove(Engine, 'after_cursor_execute', self._after_execute)
+        request_started.disconnect(self._request_started, self.app)
+        before_render_template.disconnect(self._render_started, self.app)
+        template_rendered.disconnect(self._render_finished, self.app)
+        request_finished.disconnect(self._request_finished, self.app)
+        self.app = None
+
+    def _current(self):
+        if has_request_context():
+            return g.get('_profile')
+        return None
+
+    def _request_started(self, sender, **extra):
+        g._profile = RequestProfile()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current() is not None:
+            conn.info.setdefault('profiler_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = self._current()
+        if profile is None or not conn.info.get('profiler_start'):
+            return
+        profile.sql_time += time.perf_counter() - conn.info['profiler_start'].pop()
+        profile.queries += 1
+        profile.statements[fingerprint(statement)] += 1
+
+    def _render_started(self, sender, template, context, **extra):
+        profile = self._current()
+        if profile is not None:
+            profile._render_start = time.perf_counter()
+
+    def _render_finished(self, sender, template, context, **extra):
+        profile = self._current()
+        if profile is not None and profile._render_start is not None:
+            profile.render_time += time.perf_counter() - profile._render_start
+            profile._render_start = None
+
+    def _request_finished(self, sender, response, **extra):
+        profile = self._current()
+        if profile is None:
+            return
+
+        suspects = {s: n for s, n in profile.statements.items() if n >= self.threshold}
+        endpoint = request.endpoint or request.path
+        with self._lock:
+            self.endpoints.setdefault(endpoint, EndpointStats()).add(profile, suspects)
+
+        response.headers['X-Query-Count'] = str(profile.queries)
+        response.headers['X-Query-Time-Ms'] = '{:.1f}'.format(profile.sql_time * 1000)
+        response.headers['X-Render-Time-Ms'] = '{:.1f}'.format(profile.render_time * 1000)
+        response.headers['X-N-Plus-One'] = str(len(suspects))
+
+        log = sender.logger.warning if suspects else sender.logger.info
+        log("Profiled %s: %d queries, %.1fms SQL, %.1fms render, %d likely N+1",
+            endpoint, profile.queries, profile.sql_time * 1000,
+            profile.render_time * 1000, len(suspects))
+
+    def summary(self):
+        with self._lock:
+            return sorted(self.endpoints.items(), key=lambda item: -item[1].queries)
+
+
+class ProfilerView(BaseView):
+    def __init__(self, profiler, **kwargs):
+        self.profiler = profiler
+        super(ProfilerView, self).__init__(**kwargs)
+
+    @expose('/')
+    def index(self):
+        return self.render('admin/profiler.html', endpoints=self.profiler.summary())
+
+
+profiler = Profiler()
@@ -1,18 +1,23 @@
-from flask import render_template, flash, redirect, url_for, request, jsonify
+from flask import render_template, flash, redirect, url_for, request, jsonify, g
 from flask.ctx import copy_current_request_context
 from flask_sqlalchemy import model
-from app import app, db, admin
+from app import app, db
 from app.forms import CreateRoomForm, LoginForm, PostForm, RegistrationForm, EditProfileForm, EmptyForm, ChangePasswordForm, ReportForm, ReplyForm, SearchForm
 from flask_login import current_user, login_user, login_required, logout_user
 from wtforms.validators import ValidationError
 from app.models import Post, User, Room, Reply
+from app.feed import hydrate_posts
+from app.cache import fragments
+from app.timeline import get_timeline
+from app.pagination import keyset_paginate
+from app.streaming import stream_template
+from app.last_seen import last_seen
+from app.tasks import enqueue
+from app.passwords import passwords
+from app.search import search as search_index, INDEXES as SEARCH_KINDS
+from app.leaderboard import leaderboard_query, SORT_KEYS, DEFAULT_SORT
 from werkzeug.urls import url_parse
-from datetime import datetime
-from flask_admin.contrib.sqla import ModelView
 
-admin.add_view(ModelView(User, db.session))
-admin.add_view(ModelView(Post, db.session))
-admin.add_view(ModelView(Room, db.session))
 
 
 @app.route('/', methods=['GET', 'POST'])
@@ -21,21 +26,24 @@ admin.add_view(ModelView(Room, db.session))
 def index():
     form = PostForm()
     if form.validate_on_submit():
-        post = Post(body=form.post.data, author=current_user)
+        post = Post(body=form.post.data, user_id=current_user.id)
         db.session.add(post)
+        db.session.flush()
+        get_timeline().on_post(post)
         db.session.commit()
         return redirect(url_for('index'))
 
     rooms = current_user.user_rooms()
-    page = request.args.get('page', 1, type=int)
-    posts = current_user.followed_posts().paginate(
-        page, app.config['POSTS_PER_PAGE'], False)
-    next_url = url_for('index', page=posts.next_num) \
-        if posts.has_next else None
-    prev_url = url_for('index', page=posts.prev_num) \
-        if posts.has_prev else None
+    timeline = get_timeline()
+    posts = keyset_paginate(timeline.posts(current_user), timeline.order_columns,
+                            app.config['POSTS_PER_PAGE'],
+                            before=request.args.get('before'), after=request.args.get('after'))
+    next_url = url_for('index', before=posts.before) \
+        if posts.before else None
+    prev_url = url_for('index', after=posts.after) \
+        if posts.after else None
     return render_template('index.html', title='Home', form=form,
-                           posts=posts.items, next_url=next_url,
+                           posts=hydrate_posts(posts.items, current_user), next_url=next_url,
                            prev_url=prev_url, rooms = rooms)
 
 
@@ -44,15 +52,21 @@ def index():
 def post(id):
     post = Post.query.filter_by(id=id).first_or_404()
     form = ReplyForm()
-    """
     if form.validate_on_submit():
-        reply = Reply(body=form.body.data, user_id=current_user, post_id=post.id)
-        db.session.add(reply)
+        current_user.reply_to(post, form.body.data)
         db.session.commit()
-        return redirect(url_for('index'))
-    """ 
-
-    return render_template('post.html', post=post, form=form)
+        app.logger.info("User %s replied to post id %s.", current_user.username, post.id)
+        return redirect(url_for('post', id=post.id))
+
+    replies = keyset_paginate(Reply.thread(post), (Reply.timestamp, Reply.id),
+                              app.config['REPLIES_PER_PAGE'],
+                              before=request.args.get('before'), after=request.args.get('after'))
+    next_url = url_for('post', id=post.id, before=replies.before) \
+        if replies.before else None
+    prev_url = url_for('post', id=post.id, after=replies.after) \
+        if replies.after else None
+    return render_template('post.html', post=hydrate_posts([post], current_user)[0], form=form,
+                           replies=replies.items, next_url=next_url, prev_url=prev_url)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -66,7 +80,12 @@ def login():
 
         if user is None or not user.check_password(form.password.data):
             return redirect(url_for('login'))
-        
+
+        # Upgrade hashes made with an older algorithm or round count
+        if passwords.needs_rehash(user.password_hash):
+            user.set_password(form.password.data)
+            db.session.commit()
+
         login_user(user, remember=form.remember_me.data)
         app.logger.info("User %s logged in", user.username)
 
@@ -95,6 +114,7 @@ def register():
         for x in user.followed:
             user.followed.remove(x)
 
+        enqueue('generate_avatars', digest=user.avatar_hash)
         db.session.commit()
         app.logger.info("User %s registered in", user.username)
 
@@ -106,39 +126,75 @@ def register():
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
 
-    following = user.count_following()
-    followers = user.count_followers()
-    rooms = len(user.user_rooms())
-    num_posts = user.posts.count()
-
-    page = request.args.get('page', 1, type=int)
-    posts = user.posts.order_by(Post.timestamp.desc()).paginate(
-        page, app.config['POSTS_PER_PAGE'], False)
-    next_url = url_for('user', username=user.username, page=posts.next_num) \
-        if posts.has_next else None
-    prev_url = url_for('user', username=user.username, page=posts.prev_num) \
-        if posts.has_prev else None
+    posts = keyset_paginate(user.posts, (Post.timestamp, Post.id),
+                            app.config['POSTS_PER_PAGE'],
+                            before=request.args.get('before'), after=request.args.get('after'))
+    next_url = url_for('user', username=user.username, before=posts.before) \
+        if posts.before else None
+    prev_url = url_for('user', username=user.username, after=posts.after) \
+        if posts.after else None
     form = EmptyForm()
-    return render_template('user.html', user=user, posts=posts.items,
-                           next_url=next_url, prev_url=prev_url, form=form, following=following,followers=followers, rooms = rooms, num_posts=num_posts, title=user.username)
+    return render_template('user.html', user=user, posts=hydrate_posts(posts.items, current_user),
+                           next_url=next_url, prev_url=prev_url, form=form,
+                           stats=fragments.profile_stats(user), title=user.username)
 
 @app.route('/leaderboard', methods=['GET', 'POST'])
 @login_required
 def leaderboard():
-    users = User.query.all()
-    no_users = len(users)
-
-    return render_template('leaderboard.html', users=users, no_users=no_users, title='Leaderboard')
+    sort = request.args.get('sort', DEFAULT_SORT)
+    if sort not in SORT_KEYS:
+        sort = DEFAULT_SORT
 
-@app.route('/room/<id>')
+    page = request.args.get('page', 1, type=int)
+    users = leaderboard_query(sort).paginate(
+        page, app.config['USERS_PER_PAGE'], False)
+    next_url = url_for('leaderboard', sort=sort, page=users.next_num) \
+        if users.has_next else None
+    prev_url = url_for('leaderboard', sort=sort, page=users.prev_num) \
+        if users.has_prev else None
+
+    return render_template('leaderboard.html', users=users.items, no_users=users.total,
+                           sort=sort, sort_keys=SORT_KEYS, next_url=next_url,
+                           prev_url=prev_url, title='Leaderboard')
+
+@app.route('/room/<id>', methods=['GET', 'POST'])
 @login_required
 def room(id):
     room = Room.query.filter_by(id=id).first_or_404()
-    members = room.get_members()
+    is_member = room.has_member(current_user)
+
+    form = PostForm()
+    if is_member and form.validate_on_submit():
+        post = Post(body=form.post.data, user_id=current_user.id)
+        post.set_room(room)
+        db.session.add(post)
+        db.session.flush()
+        get_timeline().on_post(post)
+        db.session.commit()
+        return redirect(url_for('room', id=room.id))
+
+    posts = keyset_paginate(room.posts, (Post.timestamp, Post.id),
+                            app.config['POSTS_PER_PAGE'],
+                            before=request.args.get('before'), after=request.args.get('after'))
+    older_url = url_for('room', id=room.id, before=posts.before) \
+        if posts.before else None
+    newer_url = url_for('room', id=room.id, after=posts.after) \
+        if posts.after else None
+
+    page = request.args.get('page', 1, type=int)
+    members = room.paginate_members(page, app.config['USERS_PER_PAGE'])
+    next_url = url_for('room', id=room.id, page=members.next_num) \
+        if members.has_next else None
+    prev_url = url_for('room', id=room.id, page=members.prev_num) \
+        if members.has_prev else None
 
     app.logger.info("User %s viewed room id:%s successfully.", current_user.username, id)
 
-    return render_template('room.html', room=room, members=members, user=current_user, title=room.name)
+    return render_template('room.html', room=room, members=members.items, no_members=members.total,
+                           is_member=is_member, next_url=next_url, prev_url=prev_url,
+                           form=form, posts=hydrate_posts(posts.items, current_user),
+                           older_url=older_url, newer_url=newer_url,
+                           user=current_user, title=room.name)
 
 @app.route('/deleteroom/<id>')
 @login_required
@@ -165,9 +221,9 @@ def deleteroom(id):
 
 @app.before_request
 def before_request():
-    if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+    if request.endpoint not in ('static', 'assets') and current_user.is_authenticated:
+        last_seen.touch(current_user)
+        g.search_form = SearchForm()
 
 @app.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
@@ -175,8 +231,9 @@ def edit_profile():
 
     form = EditProfileForm(current_user.username)
     if form.validate_on_submit():
-        current_user.username = form.username.data
-        current_user.about_me = form.about_me.data
+        user = User.query.get(current_user.id)
+        user.username = form.username.data
+        user.about_me = form.about_me.data
         db.session.commit()
         flash('Your profile has been updated.')
         app.logger.info("User %s edited profile.", current_user.username)
@@ -238,6 +295,7 @@ def follow(username):
             return redirect(url_for('user', username=username))
 
         current_user.follow(user)
+        get_timeline().on_follow(current_user, user)
         db.session.commit()
         flash('You are following {}!'.format(username))
         app.logger.info("User %s followed user %s.", current_user.username, username)
@@ -264,6 +322,7 @@ def unfollow(username):
             flash('You cannot unfollow yourself!')
             return redirect(url_for('user', username=username))
         current_user.unfollow(user)
+        get_timeline().on_unfollow(current_user, user)
         db.session.commit()
         app.logger.info("User %s  unfollowed user %s.", current_user.username, username)
 
@@ -325,12 +384,13 @@ def leave(id):
 @app.route('/rooms/all', methods=['GET', 'POST'])
 @login_required
 def allrooms():
-    all_rooms = Room.query.all()
-    no_rooms = len(all_rooms)
+    # Rooms are fetched in batches while the page streams out
+    all_rooms = Room.by_activity().yield_per(100)
+    no_rooms = Room.query.count()
 
     no_user_rooms = len(current_user.user_rooms())
     rooms = current_user.user_rooms()
-    return render_template('allrooms.html', rooms = rooms, no_rooms= no_rooms, no_user_rooms=no_user_rooms, all_rooms =all_rooms, title='All Rooms')
+    return stream_template('allrooms.html', rooms = rooms, no_rooms= no_rooms, no_user_rooms=no_user_rooms, all_rooms =all_rooms, title='All Rooms')
 
 @app.route('/like/<int:post_id>/<action>')
 @login_required
@@ -340,13 +400,13 @@ def like_action(post_id, action):
     if action == 'like':
         current_user.like_post(post)
         db.session.commit()
-        app.logger.info("User %s disliked post id %s.", current_user.username, post_id)
+        app.logger.info("User %s liked post id %s.", current_user.username, post_id)
 
 
     if action == 'unlike':
         current_user.unlike_post(post)
         db.session.commit()
-        app.logger.info("User %s liked post id %s.", current_user.username, post_id)
+        app.logger.info("User %s unliked post id %s.", current_user.username, post_id)
 
 
     return redirect(request.referrer)
@@ -358,8 +418,35 @@ def report_action(post_id):
     form = ReportForm()
 
     if form.validate_on_submit():
-        app.logger.info("User %s reported post id %s, with report body: %s", current_user.username, post_id, form.report_desc.data)
+        enqueue('report_post', post_id=post.id, user_id=current_user.id, body=form.report_desc.data)
+        db.session.commit()
 
         return redirect(url_for('index'))
 
-    return render_template('report.html', post=post, form=form, title="Report Post")
\ No newline at end of file
+    return render_template('report.html', post=post, form=form, title="Report Post")
+
+@app.route('/search')
+@login_required
+def search():
+    if not g.search_form.validate():
+        return redirect(url_for('index'))
+
+    q = g.search_form.q.data
+    kind = request.args.get('type', 'posts')
+    if kind not in SEARCH_KINDS:
+        kind = 'posts'
+
+    page = request.args.get('page', 1, type=int)
+    results = search_index(kind, q, page, app.config['SEARCH_RESULTS_PER_PAGE'])
+    next_url = url_for('search', q=q, type=kind, page=page + 1) \
+        if results.has_next else None
+    prev_url = url_for('search', q=q, type=kind, page=page - 1) \
+        if page > 1 else None
+
+    items = results.items
+    if kind == 'posts':
+        items = hydrate_posts(items, current_user)
+
+    return render_template('search.html', q=q, kind=kind, kinds=SEARCH_KINDS, results=items,
+                           rooms=current_user.user_rooms(), next_url=next_url,
+                           prev_url=prev_url, title='Search')
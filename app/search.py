@@ -0,0 +1,129 @@
+import re
+from collections import namedtuple
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import DDL, event, inspect, or_, text
+from app import db
+from app.models import User, Post, Room
+
+# One FTS5 table per searchable model. Users and posts are keyed on the
+# FTS rowid; rooms have string ids so they keep theirs in an UNINDEXED column.
+SearchIndex = namedtuple('SearchIndex', ['model', 'table', 'key', 'fields'])
+
+INDEXES = {
+    'posts': SearchIndex(Post, 'post_search', 'rowid', ('body',)),
+    'users': SearchIndex(User, 'user_search', 'rowid', ('username', 'about_me')),
+    'rooms': SearchIndex(Room, 'room_search', 'room_id', ('name', 'desc')),
+}
+
+SearchPage = namedtuple('SearchPage', ['items', 'has_next'])
+
+
+def _columns(index):
+    return ', '.join('"{}"'.format(f) for f in index.fields)
+
+
+def create_statement(index):
+    key = '' if index.key == 'rowid' else '{} UNINDEXED, '.format(index.key)
+    return 'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}{}, prefix=\'2 3\')'.format(
+        index.table, key, _columns(index))
+
+
+def rebuild_statements(index):
+    return [
+        'DELETE FROM {}'.format(index.table),
+        'INSERT INTO {0} ({1}, {2}) SELECT id, {2} FROM "{3}"'.format(
+            index.table, index.key, _columns(index), index.model.__tablename__),
+    ]
+
+
+for _index in INDEXES.values():
+    event.listen(db.metadata, 'after_create',
+                 DDL(create_statement(_index)).execute_if(dialect='sqlite'))
+    event.listen(db.metadata, 'before_drop',
+                 DDL('DROP TABLE IF EXISTS {}'.format(_index.table)).execute_if(dialect='sqlite'))
+
+
+def _index_for(obj):
+    for index in INDEXES.values():
+        if isinstance(obj, index.model):
+            return index
+    return None
+
+
+def _unindex(conn, index, key):
+    conn.execute(text('DELETE FROM {} WHERE {} = :key'.format(index.table, index.key)),
+                 {'key': key})
+
+
+def _reindex(conn, index, obj):
+    _unindex(conn, index, obj.id)
+    params = {'key': obj.id}
+    params.update({'f%d' % i: getattr(obj, f) or '' for i, f in enumerate(index.fields)})
+    conn.execute(text('INSERT INTO {} ({}, {}) VALUES (:key, {})'.format(
+        index.table, index.key, _columns(index),
+        ', '.join(':f%d' % i for i in range(len(index.fields))))), params)
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def sync_search_index(session, flush_context):
+    # Runs inside the flush's transaction, so the index commits or rolls back with it
+    conn = session.connection()
+    if conn.dialect.name != 'sqlite':
+        return
+
+    for obj in session.new:
+        index = _index_for(obj)
+        if index is not None:
+            _reindex(conn, index, obj)
+
+    for obj in session.dirty:
+        index = _index_for(obj)
+        if index is not None and any(
+                inspect(obj).attrs[f].history.has_changes() for f in index.fields):
+            _reindex(conn, index, obj)
+
+    for obj in session.deleted:
+        index = _index_for(obj)
+        if index is not None:
+            _unindex(conn, index, obj.id)
+
+
+def search(kind, q, page, per_page):
+    """Ranked, paginated search over one of INDEXES.
+
+    Every word in ``q`` must match, as a prefix. Uses FTS5's bm25 ranking on
+    SQLite and falls back to ILIKE on other databases.
+    """
+    index = INDEXES[kind]
+    terms = re.findall(r'\w+', q.lower())
+    if not terms:
+        return SearchPage([], False)
+
+    model = index.model
+    offset = (page - 1) * per_page
+
+    if db.session.connection().dialect.name == 'sqlite':
+        match = ' '.join('"{}"*'.format(t) for t in terms)
+        keys = [row[0] for row in db.session.execute(text(
+            'SELECT {0} FROM {1} WHERE {1} MATCH :match ORDER BY rank '
+            'LIMIT :limit OFFSET :offset'.format(index.key, index.table)),
+            {'match': match, 'limit': per_page + 1, 'offset': offset})]
+    else:
+        query = model.query
+        for t in terms:
+            query = query.filter(or_(*[getattr(model, f).ilike('%' + t + '%')
+                                       for f in index.fields]))
+        keys = [obj.id for obj in query.order_by(model.id.desc()).limit(
+            per_page + 1).offset(offset)]
+
+    has_next = len(keys) > per_page
+    keys = keys[:per_page]
+    found = {obj.id: obj for obj in model.query.filter(model.id.in_(keys))}
+    return SearchPage([found[k] for k in keys if k in found], has_next)
+
+
+def rebuild_search_index():
+    for index in INDEXES.values():
+        for statement in rebuild_statements(index):
+            db.session.execute(text(statement))
+    db.session.commit()
@@ -0,0 +1,27 @@
+from flask import Response, before_render_template, stream_with_context, template_rendered
+from app import app
+
+
+def stream_template(template_name, **context):
+    """Render a template as a streamed response.
+
+    Flask 2.0 has no stream_template, so this follows the one added in 2.2:
+    output is sent in chunks of STREAM_BUFFER_SIZE template events while
+    the template runs. Queries iterated inside it (e.g. with ``yield_per``)
+    are fetched as the page is written, so rows are never all in memory.
+
+    Headers and the session cookie go out before the template runs, so it
+    must not write to the session (flash messages, new CSRF tokens). The
+    profiler's headers only count queries made before the first byte.
+    """
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+
+    def generate():
+        before_render_template.send(app, template=template, context=context)
+        stream = template.stream(context)
+        stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+        yield from stream
+        template_rendered.send(app, template=template, context=context)
+
+    return Response(stream_with_context(generate()))
@@ -0,0 +1,184 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import and_, event, or_, select
+from app import app, db
+from app.models import Job, Post, User
+from app.avatars import ensure_avatars
+
+
+class TaskQueue(object):
+    """Runs registered functions in the background from a durable job table.
+
+    ``enqueue`` adds a row to the caller's session, so a job only exists if
+    the request that created it commits. Jobs are claimed with a conditional
+    UPDATE, which lets threads in several processes share the table, and a
+    job whose worker died is picked up again once its lock runs out.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def task(self, name, max_attempts=None):
+        def register(fn):
+            self.tasks[name] = (fn, max_attempts)
+            return fn
+        return register
+
+    def enqueue(self, name, delay=0, **kwargs):
+        fn, max_attempts = self.tasks[name]
+        job = Job(name=name, payload=json.dumps(kwargs),
+                  max_attempts=max_attempts or app.config['TASK_MAX_ATTEMPTS'],
+                  run_at=datetime.utcnow() + timedelta(seconds=delay))
+        db.session.add(job)
+        db.session.info['jobs'] = True
+        return job
+
+    def wake(self):
+        if app.config['TASK_QUEUE'] == 'thread':
+            self.start()
+        self._wake.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self.work, args=(app.config['TASK_WORKERS'],),
+                    name='task-queue', daemon=True)
+                self._thread.start()
+
+    def _claimable(self, now):
+        return or_(and_(Job.status == 'queued', Job.run_at <= now),
+                   and_(Job.status == 'running', Job.locked_until < now))
+
+    def claim(self):
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            candidates = conn.execute(select(Job.id).where(self._claimable(now)).order_by(
+                Job.run_at).limit(5)).scalars().all()
+            for id in candidates:
+                # Only one worker's UPDATE can match while the job is claimable
+                claimed = conn.execute(Job.__table__.update().where(
+                    Job.id == id, self._claimable(now)).values(
+                    status='running', attempts=Job.attempts + 1,
+                    locked_until=now + timedelta(seconds=app.config['TASK_TIMEOUT']))).rowcount
+                if claimed:
+                    return conn.execute(select(Job.__table__).where(Job.id == id)).first()
+        return None
+
+    def backoff(self, attempts):
+        return min(app.config['TASK_BACKOFF_MAX'], app.config['TASK_BACKOFF'] * 2 ** (attempts - 1))
+
+    def run(self, job):
+        with app.app_context():
+            try:
+                fn, _ = self.tasks[job.name]
+                fn(**json.loads(job.payload))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                if job.attempts >= job.max_attempts:
+                    app.logger.exception("Job %s (%s) failed for good", job.id, job.name)
+                    values = {'status': 'failed'}
+                else:
+                    delay = self.backoff(job.attempts)
+                    app.logger.warning("Job %s (%s) failed, retrying in %ss: %r",
+                                       job.id, job.name, delay, e)
+                    values = {'status': 'queued',
+                              'run_at': datetime.utcnow() + timedelta(seconds=delay)}
+                with db.engine.begin() as conn:
+                    conn.execute(Job.__table__.update().where(Job.id == job.id).values(
+                        locked_until=None, last_error=repr(e), **values))
+                return False
+
+            with db.engine.begin() as conn:
+                conn.execute(Job.__table__.delete().where(Job.id == job.id))
+            return True
+
+    def run_pending(self):
+        """Run due jobs in this thread until there are none left."""
+        done = 0
+        while True:
+            with app.app_context():
+                job = self.claim()
+            if job is None:
+                return done
+            self.run(job)
+            done += 1
+
+    def work(self, workers, stop=None):
+        stop = stop or threading.Event()
+        slots = threading.Semaphore(workers)
+
+        def run(job):
+            try:
+                self.run(job)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(workers, thread_name_prefix='task') as pool:
+            while not stop.is_set():
+                slots.acquire()
+                try:
+                    with app.app_context():
+                        job = self.claim()
+                except Exception:
+                    app.logger.exception("Could not claim a job")
+                    job = None
+                if job is None:
+                    slots.release()
+                    self._wake.wait(app.config['TASK_POLL_INTERVAL'])
+                    self._wake.clear()
+                    continue
+                pool.submit(run, job)
+
+
+queue = TaskQueue()
+enqueue = queue.enqueue
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+def wake_task_queue(session):
+    if session.info.pop('jobs', False):
+        queue.wake()
+
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def forget_jobs(session):
+    session.info.pop('jobs', None)
+
+
+@app.cli.command()
+@click.option('--workers', default=None, type=int, help='Jobs to run at once.')
+@click.option('--once', is_flag=True, help='Run the jobs that are due, then exit.')
+def worker(workers, once):
+    """Run queued background jobs."""
+    if once:
+        click.echo('Ran {} jobs.'.format(queue.run_pending()))
+        return
+    try:
+        queue.work(workers or app.config['TASK_WORKERS'])
+    except KeyboardInterrupt:
+        pass
+
+
+# TASKS
+
+@queue.task('report_post')
+def report_post(post_id, user_id, body):
+    post, user = Post.query.get(post_id), User.query.get(user_id)
+    if post is None or user is None:
+        return
+    app.logger.info("User %s reported post id %s, with report body: %s",
+                    user.username, post_id, body)
+
+
+@queue.task('generate_avatars')
+def generate_avatars(digest):
+    ensure_avatars(digest)
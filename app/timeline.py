@@ -0,0 +1,181 @@
+import threading
+from sqlalchemy import select, literal, or_
+from app import app, db
+from app.models import Post, TimelineEntry, followers
+
+
+class PullTimeline(object):
+    """Builds the home timeline from the followers join on every read."""
+
+    # The (timestamp, id) pair posts() is ordered on, for keyset pagination
+    order_columns = (Post.timestamp, Post.id)
+
+    def posts(self, user):
+        return user.followed_posts()
+
+    def on_post(self, post):
+        pass
+
+    def on_follow(self, follower, followed):
+        pass
+
+    def on_unfollow(self, follower, followed):
+        pass
+
+
+class SqlTimeline(PullTimeline):
+    """Fan-out-on-write into the ``timeline`` table, capped per user."""
+
+    order_columns = (TimelineEntry.timestamp, TimelineEntry.post_id)
+
+    def __init__(self, max_length):
+        self.max_length = max_length
+
+    def posts(self, user):
+        return Post.query.join(TimelineEntry, TimelineEntry.post_id == Post.id).filter(
+            TimelineEntry.user_id == user.id).order_by(
+                TimelineEntry.timestamp.desc(), TimelineEntry.post_id.desc())
+
+    def on_post(self, post):
+        # The author and everyone following them get the post in one INSERT ... SELECT
+        t = TimelineEntry.__table__
+        recipients = select(
+            followers.c.follower_id, literal(post.id), literal(post.timestamp, db.DateTime)).where(
+                followers.c.followed_id == post.user_id).union_all(
+            select(literal(post.user_id), literal(post.id), literal(post.timestamp, db.DateTime)))
+        db.session.execute(t.insert().from_select(['user_id', 'post_id', 'timestamp'], recipients))
+        self._trim(or_(t.c.user_id == post.user_id, t.c.user_id.in_(
+            select(followers.c.follower_id).where(followers.c.followed_id == post.user_id))))
+
+    def on_follow(self, follower, followed):
+        t = TimelineEntry.__table__
+        self.on_unfollow(follower, followed)
+        recent = select(literal(follower.id), Post.id, Post.timestamp).where(
+            Post.user_id == followed.id).order_by(
+                Post.timestamp.desc()).limit(self.max_length)
+        db.session.execute(t.insert().from_select(['user_id', 'post_id', 'timestamp'], recent))
+        self._trim(t.c.user_id == follower.id)
+
+    def on_unfollow(self, follower, followed):
+        t = TimelineEntry.__table__
+        db.session.execute(t.delete().where(
+            t.c.user_id == follower.id,
+            t.c.post_id.in_(select(Post.id).where(Post.user_id == followed.id))))
+
+    def rebuild(self, user):
+        t = TimelineEntry.__table__
+        db.session.execute(t.delete().where(t.c.user_id == user.id))
+        recent = select(literal(user.id), Post.id, Post.timestamp).where(or_(
+            Post.user_id == user.id,
+            Post.user_id.in_(select(followers.c.followed_id).where(
+                followers.c.follower_id == user.id)))).order_by(
+                    Post.timestamp.desc()).limit(self.max_length)
+        db.session.execute(t.insert().from_select(['user_id', 'post_id', 'timestamp'], recent))
+
+    def _trim(self, which):
+        # Drop everything older than each user's max_length-th newest entry
+        t = TimelineEntry.__table__
+        newer = t.alias()
+        cutoff = select(newer.c.timestamp).where(
+            newer.c.user_id == t.c.user_id).order_by(
+                newer.c.timestamp.desc()).limit(1).offset(
+                    self.max_length - 1).scalar_subquery()
+        db.session.execute(t.delete().where(which, t.c.timestamp < cutoff))
+
+
+class MemoryStore(object):
+    """The subset of Redis list commands StoreTimeline uses, kept in this process.
+
+    Only coherent with a single worker; pass a real Redis client to
+    StoreTimeline to share timelines between workers.
+    """
+
+    def __init__(self):
+        self._lists = {}
+        self._lock = threading.Lock()
+
+    def exists(self, key):
+        return int(key in self._lists)
+
+    def lpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            for value in values:
+                items.insert(0, value)
+            return len(items)
+
+    def rpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            items.extend(values)
+            return len(items)
+
+    def ltrim(self, key, start, stop):
+        with self._lock:
+            if key in self._lists:
+                items = self._lists[key]
+                self._lists[key] = items[start:None if stop == -1 else stop + 1]
+
+    def lrange(self, key, start, stop):
+        with self._lock:
+            items = self._lists.get(key, [])
+            return list(items[start:None if stop == -1 else stop + 1])
+
+    def delete(self, key):
+        with self._lock:
+            return int(self._lists.pop(key, None) is not None)
+
+
+class StoreTimeline(PullTimeline):
+    """Fan-out-on-write into per-user lists of post ids in a Redis-like store.
+
+    Timelines are rebuilt from the pull query the first time they're read, so
+    follow/unfollow only has to drop the follower's list.
+    """
+
+    def __init__(self, store, max_length):
+        self.store = store
+        self.max_length = max_length
+
+    def key(self, user_id):
+        return 'timeline:{}'.format(user_id)
+
+    def posts(self, user):
+        key = self.key(user.id)
+        ids = self.store.lrange(key, 0, -1)
+        if not ids:
+            ids = [p.id for p in user.followed_posts().limit(self.max_length)]
+            if ids:
+                self.store.delete(key)
+                self.store.rpush(key, *ids)
+        return Post.query.filter(Post.id.in_([int(i) for i in ids])).order_by(
+            Post.timestamp.desc(), Post.id.desc())
+
+    def on_post(self, post):
+        recipients = [row.follower_id for row in db.session.query(
+            followers.c.follower_id).filter(followers.c.followed_id == post.user_id)]
+        for user_id in recipients + [post.user_id]:
+            key = self.key(user_id)
+            # Cold timelines are rebuilt on read, so only push to warm ones
+            if self.store.exists(key):
+                self.store.lpush(key, post.id)
+                self.store.ltrim(key, 0, self.max_length - 1)
+
+    def on_follow(self, follower, followed):
+        self.store.delete(self.key(follower.id))
+
+    def on_unfollow(self, follower, followed):
+        self.store.delete(self.key(follower.id))
+
+
+def get_timeline():
+    if 'timeline' not in app.extensions:
+        backend = app.config['TIMELINE_BACKEND']
+        max_length = app.config['TIMELINE_MAX_LENGTH']
+        if backend == 'sql':
+            app.extensions['timeline'] = SqlTimeline(max_length)
+        elif backend == 'memory':
+            app.extensions['timeline'] = StoreTimeline(MemoryStore(), max_length)
+        else:
+            app.extensions['timeline'] = PullTimeline()
+    return app.extensions['timeline']
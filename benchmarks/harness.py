@@ -0,0 +1,156 @@
+"""Drive the main pages through the Flask test client and record latency.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.harness --output after.json
+    python -m benchmarks.harness --compare before.json after.json
+
+Run benchmarks.seed against the same database first. For each endpoint the
+harness reports p50/p99 latency, mean queries per request (via the query
+profiler) and peak Python memory allocated while handling a request.
+"""
+import argparse
+import json
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from sqlalchemy import func
+from app import app, db
+from app.models import User, Post, Room, followers
+from app.profiler import profiler
+from benchmarks.seed import PASSWORD
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def scenarios():
+    """(name, method, url-or-callable, form data) for each benchmarked endpoint."""
+    with app.app_context():
+        # The most-followed user gives the heaviest realistic profile and home feed
+        popular_id = db.session.query(followers.c.followed_id).group_by(
+            followers.c.followed_id).order_by(func.count().desc()).limit(1).scalar()
+        viewer = User.query.filter(User.username.like('bench%')).first()
+        popular = User.query.get(popular_id) if popular_id else viewer
+        post = Post.query.filter_by(user_id=popular.id).first() or Post.query.first()
+        room = Room.query.first()
+
+    toggles = {'like': 0, 'follow': 0}
+
+    def like_url():
+        toggles['like'] += 1
+        return '/like/{}/{}'.format(post.id, 'like' if toggles['like'] % 2 else 'unlike')
+
+    def follow_url():
+        toggles['follow'] += 1
+        return '/{}/{}'.format('follow' if toggles['follow'] % 2 else 'unfollow', popular.username)
+
+    items = [
+        ('index', 'get', '/index', None),
+        ('user', 'get', '/user/{}'.format(popular.username), None),
+        ('leaderboard', 'get', '/leaderboard', None),
+        ('like_action', 'get', like_url, None),
+        ('follow', 'post', follow_url, {}),
+    ]
+    if room is not None:
+        items.insert(3, ('room', 'get', '/room/{}'.format(room.id), None))
+    return viewer, items
+
+
+def run(requests, warmup):
+    app.config['WTF_CSRF_ENABLED'] = False
+    profiler.init_app(app)
+
+    viewer, items = scenarios()
+    client = app.test_client()
+    client.post('/login', data={'username': viewer.username, 'password': PASSWORD})
+
+    results = {}
+    tracemalloc.start()
+    for name, method, url, data in items:
+        timings, queries, peaks = [], [], []
+        for i in range(warmup + requests):
+            target = url() if callable(url) else url
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            started = time.perf_counter()
+            response = getattr(client, method)(target, data=data, headers={'Referer': '/index'})
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            if response.status_code >= 400:
+                raise RuntimeError('{} returned {}'.format(target, response.status_code))
+            if i < warmup:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(int(response.headers.get('X-Query-Count', 0)))
+            peaks.append(max(0, peak - base) / 1024.0)
+
+        results[name] = {
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'queries': round(sum(queries) / float(len(queries)), 1),
+            'peak_kb': round(max(peaks), 1),
+        }
+    tracemalloc.stop()
+
+    with app.app_context():
+        sizes = {'users': User.query.count(), 'posts': Post.query.count()}
+
+    return {'commit': git_commit(), 'time': datetime.utcnow().isoformat(),
+            'requests': requests, 'data': sizes, 'endpoints': results}
+
+
+def print_results(result):
+    print('commit {} ({users} users, {posts} posts)'.format(result['commit'], **result['data']))
+    print('{:<14}{:>10}{:>10}{:>10}{:>11}'.format('endpoint', 'p50 ms', 'p99 ms', 'queries', 'peak KB'))
+    for name, r in result['endpoints'].items():
+        print('{:<14}{:>10}{:>10}{:>10}{:>11}'.format(
+            name, r['p50_ms'], r['p99_ms'], r['queries'], r['peak_kb']))
+
+
+def compare(before, after):
+    print('{:<14}{:>26}{:>26}{:>22}'.format('endpoint', 'p50 ms', 'p99 ms', 'queries'))
+    for name, new in after['endpoints'].items():
+        old = before['endpoints'].get(name)
+        if old is None:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p99_ms', 'queries'):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append('{} -> {} ({:+.0f}%)'.format(old[key], new[key], change))
+        print('{:<14}{:>26}{:>26}{:>22}'.format(name, *cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two earlier result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            compare(json.load(f), json.load(g))
+        return
+
+    result = run(args.requests, args.warmup)
+    print_results(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Password verification throughput, inline and through the process pool.
+
+    python -m benchmarks.passwords --workers 4 --seconds 5
+
+Each login is one check_password call against a hash made with the
+configured algorithm and round count. Client threads keep the pool's queue
+full; the report gives logins/sec overall and per core used.
+"""
+import argparse
+import threading
+import time
+from app import app
+from app.passwords import PasswordService, PasswordServiceBusy
+
+
+def measure(service, pwhash, clients, seconds):
+    done = [0]
+    busy = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        while time.perf_counter() < deadline:
+            try:
+                assert service.verify(pwhash, 'benchmark')
+            except PasswordServiceBusy:
+                with lock:
+                    busy[0] += 1
+                continue
+            with lock:
+                done[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return done[0] / (time.perf_counter() - start), busy[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=app.config['PASSWORD_WORKERS'])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rounds', type=int, default=app.config['PASSWORD_HASH_ROUNDS'])
+    args = parser.parse_args()
+
+    algorithm = app.config['PASSWORD_HASH_ALGORITHM']
+    print('{}:{}, {}s per run'.format(algorithm, args.rounds, args.seconds))
+
+    inline = PasswordService(algorithm, args.rounds, workers=0)
+    pwhash = inline.hash('benchmark')
+    rate, _ = measure(inline, pwhash, 1, args.seconds)
+    print('{:<22} {:8.1f} logins/s  {:8.1f} per core'.format('inline (1 thread)', rate, rate))
+
+    pooled = PasswordService(algorithm, args.rounds, workers=args.workers,
+                             queue_limit=args.workers * 2, timeout=30)
+    pooled.verify(pwhash, 'benchmark')  # start the workers outside the timing
+    rate, busy = measure(pooled, pwhash, args.workers * 2, args.seconds)
+    pooled.shutdown()
+    print('{:<22} {:8.1f} logins/s  {:8.1f} per core  ({} rejected as busy)'.format(
+        'pool ({} workers)'.format(args.workers), rate, rate / args.workers, busy))
+
+
+if __name__ == '__main__':
+    main()
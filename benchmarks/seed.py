@@ -0,0 +1,129 @@
+"""Bulk-generate a synthetic social graph in the configured database.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.seed --users 5000
+
+Follow edges, likes and room memberships are drawn from a Zipf-like
+distribution, so a few users are very popular and most are not. Everything
+is written with executemany inserts, then the denormalized counters, search
+index and (with TIMELINE_BACKEND=sql) timelines are rebuilt.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from werkzeug.security import generate_password_hash
+from app import app, db
+from app.cli import rebuild_counters
+from app.models import User, Post, PostLike, Room, followers, members, email_digest
+from app.search import rebuild_search_index
+from app.timeline import SqlTimeline
+
+PASSWORD = 'password'
+BATCH = 5000
+
+
+def zipf_weights(n, alpha):
+    return list(accumulate(1.0 / (rank ** alpha) for rank in range(1, n + 1)))
+
+
+def insert(table, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(table.insert(), rows[start:start + BATCH])
+
+
+def seed(users, posts_per_user, follows_per_user, likes_per_user, rooms, alpha=1.1, seed=0):
+    rng = random.Random(seed)
+    db.create_all()
+
+    # Hashing is deliberately slow, so every user shares one hash
+    password_hash = generate_password_hash(PASSWORD)
+    first = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    insert(User.__table__, [
+        {'username': 'bench{}'.format(n), 'email': 'bench{}@example.com'.format(n),
+         'avatar_hash': email_digest('bench{}@example.com'.format(n)),
+         'password_hash': password_hash, 'about_me': 'Synthetic user {}'.format(n)}
+        for n in range(first, first + users)])
+    user_ids = [row.id for row in db.session.query(User.id).filter(User.id >= first)]
+
+    now = datetime.utcnow()
+    post_rows = []
+    for uid in user_ids:
+        for _ in range(rng.randint(0, 2 * posts_per_user)):
+            post_rows.append({'body': 'Post by bench{}'.format(uid), 'user_id': uid,
+                              'timestamp': now - timedelta(seconds=rng.randint(0, 30 * 86400))})
+    insert(Post.__table__, post_rows)
+    post_ids = [row.id for row in db.session.query(Post.id).filter(Post.user_id >= first)]
+
+    # Popularity is a random permutation of users weighted by rank
+    popular = user_ids[:]
+    rng.shuffle(popular)
+    user_weights = zipf_weights(len(popular), alpha)
+    post_weights = zipf_weights(len(post_ids), alpha) if post_ids else []
+
+    edges = set()
+    for uid in user_ids:
+        for followed in rng.choices(popular, cum_weights=user_weights, k=follows_per_user):
+            if followed != uid:
+                edges.add((uid, followed))
+    insert(followers, [{'follower_id': a, 'followed_id': b} for a, b in edges])
+
+    likes = set()
+    if post_ids:
+        for uid in user_ids:
+            for pid in rng.choices(post_ids, cum_weights=post_weights, k=likes_per_user):
+                likes.add((uid, pid))
+    insert(PostLike.__table__, [{'user_id': u, 'post_id': p} for u, p in likes])
+
+    room_ids = []
+    if rooms:
+        room_rows = []
+        for i in range(rooms):
+            room_id = '{:08x}'.format(rng.getrandbits(32))
+            room_ids.append(room_id)
+            room_rows.append({'id': room_id, 'name': 'Bench room {}'.format(room_id),
+                              'desc': 'Synthetic room', 'admin': rng.choice(user_ids)})
+        insert(Room.__table__, room_rows)
+
+        room_weights = zipf_weights(len(room_ids), alpha)
+        memberships = set()
+        for uid in user_ids:
+            for room_id in rng.choices(room_ids, cum_weights=room_weights, k=rng.randint(0, 3)):
+                memberships.add((uid, room_id))
+        insert(members, [{'user_id': u, 'room_id': r} for u, r in memberships])
+
+    db.session.commit()
+    rebuild_counters()
+    rebuild_search_index()
+    if app.config['TIMELINE_BACKEND'] == 'sql':
+        timeline = SqlTimeline(app.config['TIMELINE_MAX_LENGTH'])
+        for user in User.query.filter(User.id >= first).yield_per(500):
+            timeline.rebuild(user)
+        db.session.commit()
+
+    return {'users': users, 'posts': len(post_ids), 'follows': len(edges),
+            'likes': len(likes), 'rooms': len(room_ids)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts-per-user', type=int, default=10)
+    parser.add_argument('--follows-per-user', type=int, default=20)
+    parser.add_argument('--likes-per-user', type=int, default=30)
+    parser.add_argument('--rooms', type=int, default=50)
+    parser.add_argument('--alpha', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with app.app_context():
+        counts = seed(args.users, args.posts_per_user, args.follows_per_user,
+                      args.likes_per_user, args.rooms, args.alpha, args.seed)
+    print('Seeded {} in {:.1f}s'.format(
+        ', '.join('{} {}'.format(v, k) for k, v in counts.items()),
+        time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Concurrent like/post throughput with and without the SQLite profile.
+
+    python -m benchmarks.sqlite_profile --writers 8 --readers 4 --seconds 5
+
+Each run gets a fresh database file. Writer threads alternate between
+creating a post and liking one (insert + counter updates in one
+transaction) while reader threads page through the newest posts.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+from app import app, db
+from app.likes import insert_like
+from app.models import User, Post
+from config import DATABASE_PROFILES
+
+USERS = 50
+
+
+def make_engine(path, production):
+    if production:
+        return create_engine('sqlite:///' + path, **DATABASE_PROFILES['sqlite'])
+    # What the app used before: SQLAlchemy defaults and no PRAGMAs
+    return create_engine('sqlite:///' + path)
+
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'username': 'bench%d' % i, 'email': 'bench%d@example.com' % i}
+            for i in range(1, USERS + 1)])
+        conn.execute(Post.__table__.insert(), [
+            {'body': 'seed', 'user_id': i, 'timestamp': datetime.utcnow()}
+            for i in range(1, USERS + 1)])
+
+
+def write_one(conn, n):
+    user_id = random.randint(1, USERS)
+    if n % 2:
+        conn.execute(Post.__table__.insert().values(
+            body='bench post', user_id=user_id, timestamp=datetime.utcnow()))
+        return
+
+    post_id = random.randint(1, USERS)
+    # Repeated (user, post) pairs are skipped and leave the counters alone
+    if not conn.execute(insert_like(conn.dialect.name),
+                        {'uid': user_id, 'pid': post_id}).rowcount:
+        return
+    conn.execute(Post.__table__.update().where(Post.__table__.c.id == post_id).values(
+        like_count=Post.__table__.c.like_count + 1))
+    conn.execute(User.__table__.update().where(
+        User.__table__.c.id == select(Post.__table__.c.user_id).where(
+            Post.__table__.c.id == post_id).scalar_subquery()).values(
+        karma=User.__table__.c.karma + 1))
+
+
+def run(production, writers, readers, seconds):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'bench.db')
+
+    pragmas = app.config['SQLITE_PRAGMAS']
+    if not production:
+        app.config['SQLITE_PRAGMAS'] = {}
+    try:
+        engine = make_engine(path, production)
+        seed(engine)
+
+        counts = {'writes': 0, 'reads': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def writer():
+            n = 0
+            while time.monotonic() < deadline:
+                n += 1
+                try:
+                    with engine.begin() as conn:
+                        write_one(conn, n)
+                    key = 'writes'
+                except OperationalError:
+                    key = 'errors'
+                with lock:
+                    counts[key] += 1
+
+        def reader():
+            newest = select(Post.__table__).order_by(Post.__table__.c.timestamp.desc()).limit(6)
+            while time.monotonic() < deadline:
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(newest).fetchall()
+                    key = 'reads'
+                except OperationalError:
+                    key = 'errors'
+                with lock:
+                    counts[key] += 1
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)] + \
+            [threading.Thread(target=reader) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        engine.dispose()
+    finally:
+        app.config['SQLITE_PRAGMAS'] = pragmas
+
+    return {k: v / seconds for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    print('{:<12}{:>12}{:>12}{:>12}'.format('profile', 'writes/s', 'reads/s', 'errors/s'))
+    for name, production in (('default', False), ('production', True)):
+        result = run(production, args.writers, args.readers, args.seconds)
+        print('{:<12}{:>12.1f}{:>12.1f}{:>12.1f}'.format(
+            name, result['writes'], result['reads'], result['errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,26 @@
 import os
+from sqlalchemy.pool import QueuePool
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# Engine options per database profile, picked with DATABASE_PROFILE.
+# SQLite connections are pooled (rather than SQLAlchemy's default NullPool)
+# so the PRAGMAs in SQLITE_PRAGMAS are only paid once per connection.
+DATABASE_PROFILES = {
+    'sqlite': {
+        'poolclass': QueuePool,
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_pre_ping': True,
+        'connect_args': {'timeout': 15, 'check_same_thread': False},
+    },
+    'postgres': {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    },
+}
+
 class Config(object):
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'very-secret-key'
 
@@ -8,4 +28,106 @@ class Config(object):
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-    POSTS_PER_PAGE = 6
\ No newline at end of file
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE') or \
+        ('postgres' if SQLALCHEMY_DATABASE_URI.startswith('postgres') else 'sqlite')
+    SQLALCHEMY_ENGINE_OPTIONS = DATABASE_PROFILES[DATABASE_PROFILE]
+
+    # Applied to every new SQLite connection. WAL lets readers carry on
+    # while a worker writes, and busy_timeout (ms) makes writers queue for
+    # the lock instead of failing with "database is locked".
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 15000,
+        'mmap_size': 268435456,
+        'cache_size': -64000,
+    }
+
+    # JSON lines, written by a background thread and rotated by size
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    LOG_FILE = os.environ.get('LOG_FILE') or 'record.log'
+    LOG_MAX_BYTES = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT = 5
+
+    # Opt-in per-request SQL/render profiling, shown in response headers,
+    # the log and /admin/profiler
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED') == '1'
+    PROFILER_N_PLUS_ONE_THRESHOLD = 5
+
+    # Rendered post cards and profile stat blocks
+    FRAGMENT_CACHE_SIZE = 10000
+    FRAGMENT_CACHE_TTL = 300
+
+    # Identicons are generated once per user in every size the templates
+    # use, then served from disk
+    AVATAR_DIR = os.environ.get('AVATAR_DIR') or os.path.join(basedir, 'avatars')
+    AVATAR_SIZES = (14, 40, 60, 70, 110)
+
+    # `flask assets build` writes minified, fingerprinted and precompressed
+    # copies of app/static here, after downloading any ASSETS_VENDOR file
+    # (static filename -> source URL) that isn't in app/static yet
+    ASSETS_DIR = os.environ.get('ASSETS_DIR') or os.path.join(basedir, 'assets')
+    ASSETS_VENDOR = {
+        'vendor/jquery.min.js': 'https://ajax.googleapis.com/ajax/libs/jquery/3.4.1/jquery.min.js',
+    }
+
+    # Background jobs: 'thread' runs them on a pool inside each web process,
+    # 'worker' leaves them to `flask worker`. Failed jobs are retried after
+    # TASK_BACKOFF * 2^(attempt - 1) seconds, capped at TASK_BACKOFF_MAX.
+    TASK_QUEUE = os.environ.get('TASK_QUEUE') or 'thread'
+    TASK_WORKERS = 2
+    TASK_POLL_INTERVAL = 5
+    TASK_MAX_ATTEMPTS = 5
+    TASK_BACKOFF = 2
+    TASK_BACKOFF_MAX = 600
+    TASK_TIMEOUT = 300
+
+    # Password hashes are computed in a pool of PASSWORD_WORKERS processes
+    # (0 hashes inline). At most PASSWORD_QUEUE_LIMIT hashes (0 for no limit)
+    # may be queued or running; past that, or after PASSWORD_TIMEOUT seconds,
+    # the request gets a 503. Stored hashes made with another algorithm or
+    # round count are upgraded the next time their owner logs in.
+    PASSWORD_HASH_ALGORITHM = 'pbkdf2:sha256'
+    PASSWORD_HASH_ROUNDS = 260000
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS') or
+                           max(1, (os.cpu_count() or 2) // 2))
+    PASSWORD_QUEUE_LIMIT = 32
+    PASSWORD_TIMEOUT = 5
+
+    # Logged-in users are loaded from a per-process cache; entries are
+    # evicted when the user is committed and expire after USER_CACHE_TTL
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 60
+
+    POSTS_PER_PAGE = 6
+    REPLIES_PER_PAGE = 10
+    USERS_PER_PAGE = 25
+    SEARCH_RESULTS_PER_PAGE = 10
+
+    # Streamed pages (see app/streaming.py) are sent in chunks of this many
+    # template events
+    STREAM_BUFFER_SIZE = 50
+
+    # Admin list views show row counts estimated from planner statistics,
+    # refreshed at most this often (seconds)
+    ADMIN_COUNT_TTL = 300
+
+    # Home timeline: 'pull' queries followed users' posts on every read,
+    # 'sql' and 'memory' fan posts out to followers when they are written
+    TIMELINE_BACKEND = os.environ.get('TIMELINE_BACKEND') or 'pull'
+    TIMELINE_MAX_LENGTH = 800
+
+    # last_seen is only written when it is more than LAST_SEEN_GRANULARITY
+    # seconds stale, and buffered writes are flushed every
+    # LAST_SEEN_FLUSH_INTERVAL seconds or LAST_SEEN_FLUSH_SIZE users
+    LAST_SEEN_GRANULARITY = 60
+    LAST_SEEN_FLUSH_INTERVAL = 30
+    LAST_SEEN_FLUSH_SIZE = 500
+
+    # With LIKE_BUFFER set, like/unlike clicks are kept per process and
+    # written in one transaction LIKE_FLUSH_INTERVAL seconds after the first
+    # one, or once LIKE_FLUSH_SIZE are waiting
+    LIKE_BUFFER = bool(os.environ.get('LIKE_BUFFER'))
+    LIKE_FLUSH_INTERVAL = 1
+    LIKE_FLUSH_SIZE = 500
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""search index
+
+Revision ID: 79873ee56db5
+Revises: ca61b34d767c
+Create Date: 2026-10-18 15:08:40.225567
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '79873ee56db5'
+down_revision = 'ca61b34d767c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 only exists on SQLite; other databases use the ILIKE fallback
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("CREATE VIRTUAL TABLE post_search USING fts5(body, prefix='2 3')")
+    op.execute("CREATE VIRTUAL TABLE user_search USING fts5(username, about_me, prefix='2 3')")
+    op.execute("CREATE VIRTUAL TABLE room_search USING fts5(room_id UNINDEXED, name, \"desc\", prefix='2 3')")
+
+    op.execute('INSERT INTO post_search (rowid, body) SELECT id, body FROM post')
+    op.execute('INSERT INTO user_search (rowid, username, about_me) SELECT id, username, about_me FROM "user"')
+    op.execute('INSERT INTO room_search (room_id, name, "desc") SELECT id, name, "desc" FROM room')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute('DROP TABLE room_search')
+    op.execute('DROP TABLE user_search')
+    op.execute('DROP TABLE post_search')
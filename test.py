@@ -1,9 +1,41 @@
 import os
+import json
+import logging
+import shutil
 import unittest
+from datetime import datetime, timedelta
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from app import app, db, models
-from app.models import User, Post, Room
+from app.models import User, Post, Room, Reply
+from app.leaderboard import leaderboard_query
+from app.feed import hydrate_posts
+from app.cli import rebuild_counters
+from app.timeline import SqlTimeline, StoreTimeline, MemoryStore
+from app.pagination import keyset_paginate, decode_cursor
+from app.last_seen import LastSeenTracker
+from app.search import search, rebuild_search_index
+from app.logs import JsonFormatter, RequestContextFilter, DeferredQueueHandler
+from queue import SimpleQueue
+from app.profiler import profiler, fingerprint
+from benchmarks.seed import seed
+from app.cache import fragments, LRUCache
+from app.avatars import avatar_path
+from app import graph
+from app.tasks import queue
+from app.models import Job
+from app.identity import identities, load_user, CachedUser
+from app.admin_views import estimate_count, _estimates
+from app.passwords import passwords, PasswordService, PasswordServiceBusy
+from werkzeug.security import generate_password_hash
+from app import likes
+from app.likes import LikeBuffer
+from app.models import PostLike
+from sqlalchemy.exc import IntegrityError
+import gzip
+import tempfile
+from app import assets
+from app.assets import build, manifest, minify, minify_css
 from config import Config
 
 class TestCase(unittest.TestCase):
@@ -110,6 +142,179 @@ class TestCase(unittest.TestCase):
         self.assertFalse(users[0].has_liked_post(posts[0]))
         pass
 
+    # SQL TIMELINE
+    def test_sqltimeline(self):
+        users = User.query.all()
+        timeline = SqlTimeline(2)
+
+        old = Post(body="Old post", author=users[1], timestamp=datetime(2021, 1, 1))
+        db.session.add(old)
+        db.session.commit()
+
+        users[0].follow(users[1])
+        timeline.on_follow(users[0], users[1])
+        db.session.commit()
+        self.assertEqual(timeline.posts(users[0]).all(), [old])
+
+        posts = []
+        for i in range(3):
+            post = Post(body="Post %d" % i, author=users[1], timestamp=datetime(2021, 1, 2 + i))
+            db.session.add(post)
+            db.session.flush()
+            timeline.on_post(post)
+            posts.append(post)
+        db.session.commit()
+
+        self.assertEqual(timeline.posts(users[0]).all(), [posts[2], posts[1]])
+        self.assertEqual(timeline.posts(users[1]).all(), [posts[2], posts[1]])
+
+        users[0].unfollow(users[1])
+        timeline.on_unfollow(users[0], users[1])
+        db.session.commit()
+        self.assertEqual(timeline.posts(users[0]).all(), [])
+        pass
+
+    # STORE TIMELINE
+    def test_storetimeline(self):
+        users = User.query.all()
+        timeline = StoreTimeline(MemoryStore(), 800)
+
+        users[0].follow(users[1])
+        db.session.commit()
+        self.assertEqual(timeline.posts(users[0]).all(), [])
+
+        post = Post(body="Test post", author=users[1])
+        db.session.add(post)
+        db.session.flush()
+        timeline.on_post(post)
+        db.session.commit()
+        self.assertEqual(timeline.posts(users[0]).all(), [post])
+
+        other = Post(body="Other post", author=users[0])
+        db.session.add(other)
+        db.session.flush()
+        timeline.on_post(other)
+        db.session.commit()
+        self.assertEqual(timeline.posts(users[0]).all(), [other, post])
+
+        users[0].unfollow(users[1])
+        timeline.on_unfollow(users[0], users[1])
+        db.session.commit()
+        self.assertEqual(timeline.posts(users[0]).all(), [other])
+        pass
+
+    # KEYSET PAGINATION
+    def test_keysetpagination(self):
+        users = User.query.all()
+
+        # Two posts share a timestamp so the id tiebreak is exercised
+        stamps = [datetime(2021, 1, 1), datetime(2021, 1, 2), datetime(2021, 1, 2),
+                  datetime(2021, 1, 3), datetime(2021, 1, 4)]
+        for i, stamp in enumerate(stamps):
+            db.session.add(Post(body="Post %d" % i, author=users[i % 2], timestamp=stamp))
+        users[0].follow(users[1])
+        db.session.commit()
+
+        newest = users[0].followed_posts().all()
+        columns = (Post.timestamp, Post.id)
+
+        page1 = keyset_paginate(users[0].followed_posts(), columns, 2)
+        self.assertEqual(page1.items, newest[:2])
+        self.assertIsNone(page1.after)
+
+        page2 = keyset_paginate(users[0].followed_posts(), columns, 2, before=page1.before)
+        self.assertEqual(page2.items, newest[2:4])
+
+        page3 = keyset_paginate(users[0].followed_posts(), columns, 2, before=page2.before)
+        self.assertEqual(page3.items, newest[4:])
+        self.assertIsNone(page3.before)
+
+        back = keyset_paginate(users[0].followed_posts(), columns, 2, after=page3.after)
+        self.assertEqual(back.items, page2.items)
+
+        own = keyset_paginate(users[1].posts, columns, 5)
+        self.assertEqual(len(own.items), 2)
+        self.assertIsNone(decode_cursor("not a cursor"))
+        pass
+
+    # LAST SEEN
+    def test_lastseen(self):
+        users = User.query.all()
+        start = datetime(2021, 1, 1)
+        users[0].last_seen = start
+        users[1].last_seen = start
+        db.session.commit()
+
+        tracker = LastSeenTracker(granularity=60, flush_interval=3600, flush_size=2)
+
+        # Fresh enough, nothing buffered
+        tracker.touch(users[0], now=start + timedelta(seconds=30))
+        self.assertEqual(tracker.pending, {})
+
+        tracker.touch(users[0], now=start + timedelta(minutes=5))
+        self.assertEqual(len(tracker.pending), 1)
+
+        # Second stale user reaches flush_size and writes both in one batch
+        tracker.touch(users[1], now=start + timedelta(minutes=6))
+        self.assertEqual(tracker.pending, {})
+
+        db.session.expire_all()
+        self.assertEqual(users[0].last_seen, start + timedelta(minutes=5))
+        self.assertEqual(users[1].last_seen, start + timedelta(minutes=6))
+
+        # A lone touch is written once flush_interval passes, with no more traffic
+        tracker = LastSeenTracker(granularity=60, flush_interval=0.05, flush_size=100)
+        tracker.touch(users[0], now=start + timedelta(minutes=10))
+        timer = tracker._timer
+        self.assertEqual(len(tracker.pending), 1)
+        timer.join()
+        self.assertEqual(tracker.pending, {})
+        db.session.expire_all()
+        self.assertEqual(users[0].last_seen, start + timedelta(minutes=10))
+        pass
+
+    # FRAGMENT CACHE
+    def test_fragmentcache(self):
+        users = User.query.all()
+
+        post = Post(body="Test post", author=users[0])
+        db.session.add(post)
+        db.session.commit()
+
+        with app.test_request_context():
+            card = fragments.post_card(hydrate_posts([post], users[1])[0])
+            self.assertIn("🤍0", card)
+
+            users[1].like_post(post)
+            db.session.commit()
+            card = fragments.post_card(hydrate_posts([post], users[1])[0])
+            self.assertIn("🤍1", card)
+
+            users[0].username = "renamed"
+            db.session.commit()
+            card = fragments.post_card(hydrate_posts([post], users[1])[0])
+            self.assertIn("@renamed", card)
+
+            self.assertIn("<h1>0</h1>", fragments.profile_stats(users[0]).split("Following")[0])
+            users[0].follow(users[1])
+            db.session.commit()
+            self.assertIn("<h1>1</h1>", fragments.profile_stats(users[0]).split("Following")[0])
+        pass
+
+    # LRU CACHE
+    def test_lrucache(self):
+        cache = LRUCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+        cache.ttl = -1
+        cache.set("d", 4)
+        self.assertIsNone(cache.get("d"))
+        pass
+
     # CREATE ROOM
     def test_createroom(self):
         users = User.query.all()
@@ -155,6 +360,29 @@ class TestCase(unittest.TestCase):
         self.assertTrue(users[0] not in temp.get_members())
         pass
 
+    # ROOM MEMBERS
+    def test_roommembers(self):
+        users = User.query.all()
+
+        temp = Room()
+        temp.new_room(users[0])
+        temp.set_name("test room")
+        temp.set_desc("room users for testing")
+        db.session.commit()
+
+        users[1].join_room(temp)
+        users[1].join_room(temp)
+        db.session.commit()
+
+        self.assertEqual(temp.count_members(), 2)
+        self.assertTrue(temp.has_member(users[1]))
+        self.assertFalse(temp.has_member(users[2]))
+
+        page = temp.paginate_members(1, 1)
+        self.assertEqual(page.total, 2)
+        self.assertEqual(len(page.items), 1)
+        pass
+
     # REPORT POST
     def test_reportpost(self):
         users = User.query.all()
@@ -170,6 +398,635 @@ class TestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         pass
     
+    # LEADERBOARD STATS
+    def test_leaderboard(self):
+        users = User.query.all()
+
+        post = Post(body="Test post", author=users[0])
+        db.session.add(post)
+        db.session.commit()
+
+        users[1].like_post(post)
+        users[2].like_post(post)
+        users[1].follow(users[0])
+        db.session.commit()
+
+        rows = leaderboard_query('likes').all()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0].User, users[0])
+        self.assertEqual(rows[0].likes, 2)
+        self.assertEqual(rows[0].followers, 1)
+
+        rows = leaderboard_query('following').all()
+        self.assertEqual(rows[0].User, users[1])
+        self.assertEqual(rows[0].following, 1)
+        pass
+
+    # FEED HYDRATION
+    def test_hydrateposts(self):
+        users = User.query.all()
+
+        post1 = Post(body="Test post", author=users[0])
+        post2 = Post(body="Other post", author=users[1])
+        db.session.add_all([post1, post2])
+        db.session.commit()
+
+        users[0].like_post(post2)
+        users[1].like_post(post2)
+        db.session.commit()
+
+        feed = hydrate_posts([post1, post2], users[0])
+        self.assertEqual([p.id for p in feed], [post1.id, post2.id])
+        self.assertEqual(feed[1].author, users[1])
+        self.assertEqual((feed[0].like_count, feed[0].liked), (0, False))
+        self.assertEqual((feed[1].like_count, feed[1].liked), (2, True))
+        pass
+
+    # LIKE AND REPLY COUNTERS
+    def test_counters(self):
+        users = User.query.all()
+
+        post = Post(body="Test post", author=users[0])
+        db.session.add(post)
+        db.session.commit()
+
+        users[1].like_post(post)
+        users[2].like_post(post)
+        users[2].like_post(post)
+        users[1].reply_to(post, "Test reply")
+        db.session.commit()
+
+        self.assertEqual((post.like_count, post.reply_count), (2, 1))
+        self.assertEqual(users[0].karma, 2)
+
+        users[2].unlike_post(post)
+        db.session.commit()
+
+        self.assertEqual(post.like_count, 1)
+        self.assertEqual(users[0].no_likes(), 1)
+        pass
+
+    # RECOUNT COUNTERS
+    def test_recount(self):
+        users = User.query.all()
+
+        post = Post(body="Test post", author=users[0])
+        db.session.add(post)
+        db.session.commit()
+
+        users[1].like_post(post)
+        post.like_count = 10
+        users[0].karma = 10
+        db.session.commit()
+
+        rebuild_counters()
+
+        self.assertEqual(post.like_count, 1)
+        self.assertEqual(users[0].karma, 1)
+        pass
+
+    # SQLITE PROFILE
+    def test_sqlitepragmas(self):
+        self.assertEqual(db.session.execute('PRAGMA journal_mode').scalar(), 'wal')
+        self.assertEqual(db.session.execute('PRAGMA synchronous').scalar(), 1)
+        self.assertEqual(db.session.execute('PRAGMA busy_timeout').scalar(), 15000)
+        pass
+
+    # SEARCH
+    def test_search(self):
+        users = User.query.all()
+
+        users[1].about_me = "Likes gardening"
+        db.session.add(Post(body="Tomatoes in the garden", author=users[0]))
+        db.session.add(Post(body="Nothing to see here", author=users[0]))
+        db.session.commit()
+
+        self.assertEqual([p.body for p in search('posts', 'gard', 1, 10).items],
+                         ["Tomatoes in the garden"])
+        self.assertEqual(search('users', 'garden', 1, 10).items, [users[1]])
+
+        users[1].about_me = "Likes cooking"
+        db.session.commit()
+        self.assertEqual(search('users', 'garden', 1, 10).items, [])
+
+        temp = Room()
+        temp.new_room(users[0])
+        temp.set_name("Garden club")
+        temp.set_desc("Talk about plants")
+        db.session.commit()
+        self.assertEqual(search('rooms', 'plants', 1, 10).items, [temp])
+
+        rebuild_search_index()
+        page = search('posts', 'the', 1, 1)
+        self.assertEqual(len(page.items), 1)
+        self.assertFalse(page.has_next)
+        self.assertEqual(search('posts', '"*', 1, 10).items, [])
+        pass
+
+    # STRUCTURED LOGGING
+    def test_jsonlogging(self):
+        record = logging.LogRecord("app", logging.INFO, __file__, 1, "User %s logged in", ("user1",), None)
+
+        with app.test_request_context('/login', headers={'X-Request-ID': 'abc123'}):
+            RequestContextFilter().filter(record)
+
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['message'], "User user1 logged in")
+        self.assertEqual(entry['request_id'], "abc123")
+        self.assertEqual(entry['route'], "login")
+        self.assertIsNone(entry['user_id'])
+
+        # Tracebacks reach the listener's formatter unformatted
+        records = SimpleQueue()
+        logger = logging.getLogger('test_jsonlogging')
+        logger.propagate = False
+        handler = DeferredQueueHandler(records)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        try:
+            raise ValueError("bad value")
+        except ValueError:
+            logger.exception("boom %s", 1)
+
+        record = records.get()
+        self.assertIsNotNone(record.exc_info)
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['message'], "boom 1")
+        self.assertIn("ValueError: bad value", entry['exc_info'])
+        pass
+
+    # QUERY PROFILER
+    def test_profiler(self):
+        self.assertEqual(fingerprint("SELECT * FROM post\n WHERE id = 3 AND user_id IN (?, ?, ?)"),
+                         fingerprint("SELECT * FROM post WHERE id = 12 AND user_id IN (?, ?)"))
+
+        if profiler.app is None:
+            profiler.init_app(app)
+            self.addCleanup(profiler.remove_app)
+        response = self.app.get('/login')
+        self.assertIn('X-Query-Count', response.headers)
+        self.assertIn('X-N-Plus-One', response.headers)
+        self.assertIn('login', dict(profiler.summary()))
+
+        profiler.remove_app()
+        self.assertNotIn('X-Query-Count', self.app.get('/login').headers)
+        profiler.init_app(app)
+        pass
+
+    # BENCHMARK SEEDING
+    def test_seed(self):
+        db.session.commit()
+        counts = seed(users=20, posts_per_user=3, follows_per_user=4, likes_per_user=5, rooms=3)
+
+        self.assertEqual(User.query.count(), 23)
+        self.assertEqual(Post.query.count(), counts['posts'])
+        self.assertEqual(sum(p.like_count for p in Post.query), counts['likes'])
+        pass
+
+    # AVATARS
+    def test_avatar(self):
+        self.addCleanup(app.config.__setitem__, 'AVATAR_DIR', app.config['AVATAR_DIR'])
+        app.config['AVATAR_DIR'] = os.path.join(os.path.dirname(__file__), 'test_avatars')
+        self.addCleanup(shutil.rmtree, app.config['AVATAR_DIR'], True)
+        user = User.query.filter_by(username="user1").first()
+        self.assertEqual(user.avatar_hash, models.email_digest("user1@gmail.com"))
+
+        user.email = "User1@Example.com"
+        self.assertEqual(user.avatar_hash, models.email_digest("user1@example.com"))
+        db.session.commit()
+
+        with app.test_request_context():
+            url = user.avatar(60)
+        response = self.app.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[:8], b'\x89PNG\r\n\x1a\n')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        response.close()
+        for size in app.config['AVATAR_SIZES']:
+            self.assertTrue(os.path.exists(avatar_path(user.avatar_hash, size)))
+
+        self.assertEqual(self.app.get('/avatar/{}/61'.format(user.avatar_hash)).status_code, 404)
+
+        response = self.app.get('/avatar/{}/60'.format('ab' * 16))
+        self.assertEqual(response.data[:8], b'\x89PNG\r\n\x1a\n')
+        self.assertFalse(os.path.exists(avatar_path('ab' * 16, 60)))
+        self.assertEqual(self.app.get('/avatar/nothex/60').status_code, 404)
+        pass
+
+    # SOCIAL GRAPH
+    def test_graph(self):
+        users = User.query.all()
+        user4 = User(username="user4", email="user4@gmail.com")
+        db.session.add(user4)
+        db.session.flush()
+        ids = [u.id for u in users]
+
+        self.assertEqual(graph.follow_many(ids[0], ids + [user4.id]), 3)
+        self.assertEqual(graph.follow_many(ids[0], ids), 0)
+        graph.follow_many(ids[1], [ids[0], user4.id])
+        graph.follow_many(ids[2], [user4.id])
+        db.session.commit()
+
+        self.assertTrue(users[0].is_following(users[1]))
+        self.assertFalse(users[1].is_following(users[2]))
+        self.assertEqual(graph.following_ids(ids[1], ids), {ids[0]})
+        self.assertEqual(graph.mutual_follows(ids[0]).all(), [users[1]])
+
+        # user3 is followed by user1, who user2 follows; user4 already is
+        self.assertEqual(graph.suggestions(ids[1]), [(users[2], 1)])
+
+        self.assertEqual(graph.unfollow_many(ids[0], [ids[1], ids[2]]), 2)
+        db.session.commit()
+        self.assertEqual(users[0].count_following(), 1)
+        self.assertEqual(graph.mutual_follows(ids[0]).all(), [])
+        pass
+
+    # BACKGROUND JOBS
+    def test_tasks(self):
+        self.addCleanup(app.config.__setitem__, 'TASK_QUEUE', app.config['TASK_QUEUE'])
+        app.config['TASK_QUEUE'] = 'worker'
+        calls = []
+
+        @queue.task('test_flaky', max_attempts=2)
+        def flaky(n):
+            calls.append(n)
+            if len(calls) == 1:
+                raise ValueError('first attempt fails')
+
+        queue.enqueue('test_flaky', n=1)
+        db.session.rollback()
+        self.assertEqual(Job.query.count(), 0)
+
+        queue.enqueue('test_flaky', n=1)
+        db.session.commit()
+        self.assertEqual(queue.run_pending(), 1)
+        job = Job.query.one()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('first attempt fails', job.last_error)
+        self.assertGreater(job.run_at, datetime.utcnow())
+
+        # Not due until the backoff has passed
+        self.assertEqual(queue.run_pending(), 0)
+        Job.query.update({Job.run_at: datetime.utcnow()})
+        db.session.commit()
+        self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(calls, [1, 1])
+        self.assertEqual(Job.query.count(), 0)
+        self.assertEqual(queue.backoff(3), app.config['TASK_BACKOFF'] * 4)
+        pass
+
+    # ROOM FEEDS
+    def test_roomfeed(self):
+        users = User.query.all()
+        quiet, busy = Room(name="quiet"), Room(name="busy")
+        quiet.new_room(users[0])
+        busy.new_room(users[0])
+        db.session.add_all([quiet, busy])
+        db.session.commit()
+        busy_id = busy.id
+
+        self.app.post('/login', data={'username': "user1", 'password': "user1"})
+        for i in range(3):
+            self.app.post('/room/{}'.format(busy_id), data={'post': "Room post {}".format(i)})
+
+        busy = Room.query.get(busy_id)
+        self.assertEqual(busy.post_count, 3)
+        self.assertEqual([r.name for r in Room.by_activity()], ["busy", "quiet"])
+        self.assertEqual(busy.posts.count(), 3)
+
+        response = self.app.get('/room/{}'.format(busy_id))
+        self.assertIn(b"Room post 2", response.data)
+
+        # Non-members can read the feed but not post to it
+        self.app.get('/logout')
+        self.app.post('/login', data={'username': "user2", 'password': "user2"})
+        self.app.post('/room/{}'.format(busy_id), data={'post': "Intruder"})
+        self.assertEqual(Room.query.get(busy_id).posts.count(), 3)
+
+        Room.query.update({Room.post_count: 0})
+        db.session.commit()
+        rebuild_counters()
+        self.assertEqual(Room.query.get(busy_id).post_count, 3)
+        pass
+
+    # USER CACHE
+    def test_identitycache(self):
+        db.session.commit()
+        user = User.query.filter_by(username="user1").first()
+        user_id = user.id
+        identities.clear()
+
+        with app.test_request_context():
+            first = load_user(str(user_id))
+            self.assertIsInstance(first, CachedUser)
+            self.assertEqual(first, user)
+            self.assertIsNotNone(identities.get(user_id))
+            with self.assertRaises(AttributeError):
+                first.username = "changed"
+
+            # Served from the cache; methods needing more than the id load the User
+            cached = load_user(str(user_id))
+            self.assertEqual(cached.username, "user1")
+            self.assertFalse(cached.is_following(user))
+            self.assertEqual(cached.user_rooms(), [])
+
+        self.app.post('/login', data={'username': "user1", 'password': "user1"})
+        self.app.post('/edit_profile', data={'username': "renamed", 'about_me': "hi"})
+        self.assertIsNone(identities.get(user_id))
+        with app.test_request_context():
+            self.assertEqual(load_user(str(user_id)).username, "renamed")
+        pass
+
+    # REPLIES
+    def test_replies(self):
+        users = User.query.all()
+        post = Post(body="Test post", author=users[0])
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+
+        self.app.post('/login', data={'username': "user2", 'password': "user2"})
+        for i in range(12):
+            self.app.post('/post/{}'.format(post_id), data={'body': "Reply {}".format(i)})
+
+        post = Post.query.get(post_id)
+        self.assertEqual(post.reply_count, 12)
+
+        page = keyset_paginate(Reply.thread(post), (Reply.timestamp, Reply.id), 10)
+        self.assertEqual([r.body for r in page.items[:2]], ["Reply 11", "Reply 10"])
+        self.assertIn('author', page.items[0].__dict__)
+
+        if profiler.app is None:
+            profiler.init_app(app)
+            self.addCleanup(profiler.remove_app)
+        response = self.app.get('/post/{}'.format(post_id))
+        self.assertIn(b"Reply 11", response.data)
+        self.assertNotIn(b"Reply 1<", response.data)
+        self.assertEqual(response.headers['X-N-Plus-One'], '0')
+        self.assertIn(b"12</a>", response.data)
+        pass
+
+    # JSON API
+    def test_api(self):
+        users = User.query.all()
+        post = Post(body="Test post", author=users[1])
+        db.session.add(post)
+        users[0].follow(users[1])
+        db.session.commit()
+        post_id = post.id
+
+        self.assertEqual(self.app.get('/api/v1/timeline').status_code, 401)
+        self.app.post('/login', data={'username': "user1", 'password': "user1"})
+
+        response = self.app.get('/api/v1/timeline')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.json['posts']], [post_id])
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+        self.assertEqual(self.app.get('/api/v1/timeline',
+                                      headers={'If-None-Match': etag}).status_code, 304)
+
+        for _ in range(2):
+            response = self.app.put('/api/v1/posts/{}/like'.format(post_id))
+            self.assertEqual(response.json, {'id': post_id, 'like_count': 1, 'liked': True})
+        response = self.app.get('/api/v1/timeline', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['posts'][0]['liked'])
+
+        for _ in range(2):
+            response = self.app.delete('/api/v1/posts/{}/like'.format(post_id))
+            self.assertEqual(response.json['like_count'], 0)
+
+        response = self.app.get('/api/v1/users/user2')
+        self.assertEqual(response.json['followers'], 1)
+        self.assertTrue(response.json['is_following'])
+        self.assertEqual(self.app.get('/api/v1/users/nobody').status_code, 404)
+        pass
+
+    # ADMIN VIEWS
+    def test_adminviews(self):
+        users = User.query.all()
+        for i in range(60):
+            db.session.add(Post(body="Post {}".format(i), author=users[i % 2]))
+        users[0].follow(users[1])
+        db.session.commit()
+        ids = [p.id for p in Post.query.order_by(Post.id.desc())]
+        follower_id, followed_id = users[0].id, users[1].id
+
+        _estimates.clear()
+        self.assertGreaterEqual(estimate_count(Post.__table__), 60)
+
+        response = self.app.get('/admin/post/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Post 59", response.data)
+        self.assertNotIn(b"Post 9\n", response.data)
+        self.assertIn('before={}"'.format(ids[49]).encode(), response.data)
+
+        response = self.app.get('/admin/post/?before={}'.format(ids[49]))
+        self.assertIn(b"Post 9\n", response.data)
+        self.assertNotIn(b"Post 10\n", response.data)
+        self.assertNotIn(b'class="next"', response.data)
+
+        response = self.app.get('/admin/post/?flt0_0={}'.format(follower_id))
+        self.assertIn(b"Post 58\n", response.data)
+        self.assertNotIn(b"Post 59\n", response.data)
+
+        response = self.app.get('/admin/followers/?followed_id={}'.format(followed_id))
+        self.assertIn('<td>{}</td>'.format(follower_id).encode(), response.data)
+        stats = fragments.profile_stats(User.query.get(follower_id))
+        self.assertIn("<h1>1</h1>", stats.split("Following")[0])
+        self.app.post('/admin/followers/delete',
+                      data={'follower_id': follower_id, 'followed_id': followed_id})
+        self.assertFalse(graph.is_following(follower_id, followed_id))
+        self.assertEqual(self.app.get('/admin/followers/?follower_id=abc').status_code, 400)
+        stats = fragments.profile_stats(User.query.get(follower_id))
+        self.assertIn("<h1>0</h1>", stats.split("Following")[0])
+
+        for url in ('/admin/user/', '/admin/room/', '/admin/postlike/', '/admin/reply/',
+                    '/admin/members/'):
+            self.assertEqual(self.app.get(url).status_code, 200)
+        pass
+
+    # ADMIN DELETES
+    def test_admindeletes(self):
+        users = User.query.all()
+        room = Room(name="Room")
+        room.new_room(users[0])
+        db.session.add(room)
+        post = Post(body="Room post", author=users[0])
+        db.session.add(post)
+        post.set_room(room)
+        db.session.flush()
+        users[1].like_post(post)
+        users[2].like_post(post)
+        users[1].reply_to(post, "Test reply")
+        db.session.commit()
+        post_id, room_id, author_id = post.id, room.id, users[0].id
+        like_id = PostLike.query.filter_by(user_id=users[1].id).one().id
+        reply_id = Reply.query.one().id
+
+        self.app.post('/admin/postlike/delete/', data={'id': like_id})
+        post = Post.query.get(post_id)
+        self.assertEqual((post.like_count, post.author.karma), (1, 1))
+
+        self.app.post('/admin/reply/delete/', data={'id': reply_id})
+        self.assertEqual(Post.query.get(post_id).reply_count, 0)
+
+        self.app.post('/admin/post/delete/', data={'id': post_id})
+        self.assertIsNone(Post.query.get(post_id))
+        self.assertEqual(User.query.get(author_id).karma, 0)
+        self.assertEqual(Room.query.get(room_id).post_count, 0)
+        self.assertEqual(PostLike.query.count(), 0)
+        pass
+
+    # PASSWORDS
+    def test_passwords(self):
+        user = User.query.filter_by(username="user1").first()
+        self.assertFalse(passwords.needs_rehash(user.password_hash))
+        self.assertTrue(user.check_password("user1"))
+        self.assertFalse(user.check_password("user2"))
+
+        user.password_hash = generate_password_hash("user1", 'pbkdf2:sha256:1000')
+        db.session.commit()
+        self.assertTrue(passwords.needs_rehash(user.password_hash))
+
+        response = self.app.post('/login', data={'username': "user1", 'password': "user1"})
+        self.assertEqual(response.status_code, 302)
+        user = User.query.filter_by(username="user1").first()
+        self.assertFalse(passwords.needs_rehash(user.password_hash))
+        self.assertTrue(user.check_password("user1"))
+
+        slow = PasswordService('pbkdf2:sha256', 2000000, workers=1, queue_limit=1, timeout=0.01)
+        with self.assertRaises(PasswordServiceBusy):
+            slow.hash("timed out")
+        with self.assertRaises(PasswordServiceBusy):
+            slow.hash("queue full")
+        slow.shutdown()
+
+        unlimited = PasswordService('pbkdf2:sha256', 1000, workers=1, queue_limit=0)
+        self.assertTrue(unlimited.verify(unlimited.hash("secret"), "secret"))
+        unlimited.shutdown()
+        pass
+
+    # IDEMPOTENT LIKES
+    def test_likes(self):
+        users = User.query.all()
+        post = Post(body="Test post", author=users[0])
+        db.session.add(post)
+        db.session.commit()
+        post_id, author_id = post.id, users[0].id
+
+        db.session.add(PostLike(user_id=users[1].id, post_id=post_id))
+        db.session.add(PostLike(user_id=users[1].id, post_id=post_id))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        # A click that raced another one changes nothing
+        likes.set_like(users[1].id, post, True)
+        likes.set_like(users[1].id, post, True)
+        likes.set_like(users[2].id, post, False)
+        db.session.commit()
+        self.assertEqual(PostLike.query.filter_by(post_id=post_id).count(), 1)
+        self.assertEqual(Post.query.get(post_id).like_count, 1)
+
+        likes.like_buffer = LikeBuffer(flush_interval=60, flush_size=100)
+        try:
+            users[2].like_post(post)
+            users[1].unlike_post(post)
+            users[1].like_post(post)
+            users[1].unlike_post(post)
+            self.assertTrue(users[2].has_liked_post(post))
+            self.assertFalse(users[1].has_liked_post(post))
+            self.assertEqual(PostLike.query.filter_by(post_id=post_id).count(), 1)
+
+            # Only the viewer's own pending clicks are overlaid
+            feed = hydrate_posts([Post.query.get(post_id)], users[2])
+            self.assertEqual((feed[0].like_count, feed[0].liked), (2, True))
+
+            # ... and never reach the cached cards other viewers share
+            with app.test_request_context():
+                fragments.post_card(hydrate_posts([Post.query.get(post_id)], users[1])[0])
+                card = fragments.post_card(hydrate_posts([Post.query.get(post_id)], users[0])[0])
+            self.assertIn("🤍1<", card)
+
+            likes.like_buffer.flush()
+        finally:
+            likes.like_buffer = None
+
+        db.session.expire_all()
+        self.assertEqual([l.user_id for l in PostLike.query.filter_by(post_id=post_id)],
+                         [users[2].id])
+        self.assertEqual(Post.query.get(post_id).like_count, 1)
+        self.assertEqual(User.query.get(author_id).karma, 1)
+        pass
+
+    # STREAMED PAGES
+    def test_streaming(self):
+        for i in range(120):
+            db.session.add(Room(id='r{:03d}'.format(i), name='Room {}'.format(i)))
+        db.session.commit()
+
+        self.app.post('/login', data={'username': "user1", 'password': "user1"})
+        response = self.app.get('/rooms/all', buffered=False)
+        self.assertTrue(response.is_streamed)
+        chunks = list(response.response)
+        self.assertGreater(len(chunks), 1)
+
+        body = b''.join(chunks)
+        self.assertIn(b"There are 120 rooms", body)
+        self.assertIn(b"Room 0\n", body)
+        self.assertIn(b"Room 119\n", body)
+        response.close()
+        pass
+
+    # STATIC ASSETS
+    def test_assets(self):
+        # Build from a copy of styles.css alone, so neither a vendored jQuery
+        # from `flask assets build` nor an installed brotli changes the result
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        static = os.path.join(root, 'static')
+        os.makedirs(static)
+        shutil.copy(os.path.join(app.static_folder, 'styles.css'), static)
+
+        self.addCleanup(setattr, app, 'static_folder', app.static_folder)
+        self.addCleanup(app.config.__setitem__, 'ASSETS_DIR', app.config['ASSETS_DIR'])
+        self.addCleanup(manifest.update, dict(manifest))
+        self.addCleanup(manifest.clear)
+        self.addCleanup(setattr, assets, 'brotli', assets.brotli)
+        app.static_folder = static
+        app.config['ASSETS_DIR'] = os.path.join(root, 'dist')
+        assets.brotli = None
+
+        manifest.update(build(app.static_folder, app.config['ASSETS_DIR']))
+        styles = manifest['styles.css']
+        self.assertRegex(styles, r'^styles\.[0-9a-f]{12}\.css$')
+
+        response = self.app.get('/login')
+        self.assertIn('href="/assets/{}"'.format(styles).encode(), response.data)
+        self.assertIn(app.config['ASSETS_VENDOR']['vendor/jquery.min.js'].encode(),
+                      response.data)
+
+        with open(os.path.join(app.static_folder, 'styles.css')) as f:
+            minified = minify_css(f.read()).encode('utf-8')
+        script = b"var html = `<p>\n    indented\n</p>`;\n"
+        self.assertEqual(minify('app.js', script), script)
+
+        response = self.app.get('/assets/' + styles, headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), minified)
+        response.close()
+
+        response = self.app.get('/assets/' + styles)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, minified)
+        response.close()
+        pass
+
     # LOGIN USER
     def test_loginuser(self):
         response = self.app.get('/login',